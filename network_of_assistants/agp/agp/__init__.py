@@ -1,12 +1,31 @@
 import asyncio
-import datetime
-from typing import Coroutine
+import contextlib
+import random
+from typing import Callable, Coroutine, Hashable, Optional
 
 import agp_bindings
 
+from . import loopback
+from .codec import get_codec
+from .dispatch import BLOCK
+from .sessions import Session, SessionManager
+
 
 class AGP:
-    def __init__(self, agp_endpoint: str, local_id: str, shared_space: str):
+    def __init__(
+        self,
+        agp_endpoint: str,
+        local_id: str,
+        shared_space: str,
+        batch_window: Optional[float] = None,
+        batch_max_messages: int = 32,
+        batch_max_bytes: int = 64 * 1024,
+        reconnect_initial_delay: float = 0.05,
+        reconnect_max_delay: float = 10.0,
+        max_reconnect_attempts: Optional[int] = None,
+        replay_buffer_size: int = 1024,
+        codec: str = "json",
+    ):
         # init tracing
         agp_bindings.init_tracing(log_level="info", enable_opentelemetry=False)
 
@@ -25,12 +44,60 @@ class AGP:
         )
 
         self.session_info: agp_bindings.PySessionInfo = None
+        self.session: Session = None
+        self.sessions: SessionManager = None
         self.participant: agp_bindings.Gateway = None
         self.agp_endpoint = agp_endpoint
 
+        # encoding of the messages sent with send, decode accepts any encoding
+        self.codec = get_codec(codec)
+
+        # opt-in coalescing of outgoing messages, window in seconds
+        self.batch_window = batch_window
+        self.batch_max_messages = batch_max_messages
+        self.batch_max_bytes = batch_max_bytes
+
+        # reconnect with exponential backoff, in seconds, and the number of
+        # unsent messages kept for replay meanwhile
+        self.reconnect_initial_delay = reconnect_initial_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self.max_reconnect_attempts = max_reconnect_attempts
+        self.replay_buffer_size = replay_buffer_size
+        self.reconnects = 0
+
+        self.receive_task: asyncio.Task = None
+        self._exit_stack = contextlib.AsyncExitStack()
+        self._watch_task: asyncio.Task = None
+        self._reconnect_task: asyncio.Task = None
+        self._closed = asyncio.Event()
+
     async def init(self):
         print(self.local_organization, self.local_namespace, self.local_agent)
-        self.participant = await agp_bindings.Gateway.new(
+        await self._connect()
+
+        self.sessions = SessionManager(
+            self.participant,
+            self.remote_organization,
+            self.remote_namespace,
+            batch_window=self.batch_window,
+            batch_max_messages=self.batch_max_messages,
+            batch_max_bytes=self.batch_max_bytes,
+            replay_buffer_size=self.replay_buffer_size,
+        )
+        self.sessions.on_failure = self._schedule_reconnect
+
+        # open the default session on the shared space
+        self.session = await self.sessions.open(self.shared_space, self.shared_space)
+        self.session_info = self.session.info
+
+    async def _connect(self):
+        # a loopback:// endpoint runs against an in-process fake gateway
+        gateway = (
+            loopback.Gateway
+            if loopback.is_loopback(self.agp_endpoint)
+            else agp_bindings.Gateway
+        )
+        self.participant = await gateway.new(
             self.local_organization, self.local_namespace, self.local_agent
         )
         self.participant.configure(
@@ -40,57 +107,131 @@ class AGP:
         # Connect to gateway server
         _ = await self.participant.connect()
 
-        # set route for the chat, so that messages can be sent to the other participants
-        await self.participant.set_route(
-            self.remote_organization, self.remote_namespace, self.shared_space
+        # start the gateway receive loop, which dispatches incoming messages
+        # to the queues of the sessions they belong to
+        await self._exit_stack.enter_async_context(self.participant)
+        self._watch_task = asyncio.create_task(
+            self._watch_gateway(self.participant.task)
         )
 
-        # Subscribe to the producer topic
-        await self.participant.subscribe(
-            self.remote_organization, self.remote_namespace, self.shared_space
-        )
+    async def _watch_gateway(self, task: asyncio.Task):
+        # the gateway receive loop dies on unexpected errors, leaving the
+        # session queues silent, so treat that as a lost connection
+        await asyncio.wait([task])
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Gateway receive loop failed: {task.exception()}")
+            self.sessions.fail(task.exception())
 
-        # create pubsubb session. A pubsub session is a just a bidirectional
-        # streaming session, where participants are both sender and receivers
-        self.session_info = await self.participant.create_streaming_session(
-            agp_bindings.PyStreamingConfiguration(
-                agp_bindings.PySessionDirection.BIDIRECTIONAL,
-                topic=agp_bindings.PyAgentType(
-                    self.remote_organization, self.remote_namespace, self.shared_space
-                ),
-                max_retries=5,
-                timeout=datetime.timedelta(seconds=5),
-            )
-        )
+    def _schedule_reconnect(self, e: Exception):
+        if self._closed.is_set():
+            return
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    async def _stop_gateway(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        try:
+            # leaving the gateway context re-raises the error its receive
+            # loop died with, which is already being handled
+            await self._exit_stack.aclose()
+        except Exception:
+            pass
+
+    async def _reconnect(self):
+        delay = self.reconnect_initial_delay
+        attempt = 0
+        while True:
+            await self._stop_gateway()
+            try:
+                await self.participant.disconnect()
+            except Exception:
+                pass
+
+            attempt += 1
+            try:
+                # the gateway service keeps its sessions across connections,
+                # so start over with a fresh one and re-run set_route,
+                # subscribe and create_streaming_session on it
+                await self._connect()
+                await self.sessions.restore(self.participant)
+            except Exception as e:
+                print(f"Reconnect attempt {attempt} failed: {e}")
+            else:
+                self.reconnects += 1
+                self.session_info = self.session.info
+                print(f"Reconnected to the gateway after {attempt} attempt(s)")
+
+                # a publish failing during the replay marks the connection
+                # lost again, and as this task is still running no other
+                # reconnect is scheduled: start over until the backlog is out
+                await self.sessions.replay()
+                if self.sessions.connected:
+                    return
+                print("Connection lost while replaying unsent messages")
+
+            if self.max_reconnect_attempts and attempt >= self.max_reconnect_attempts:
+                print("Giving up reconnecting to the gateway")
+                self._closed.set()
+                return
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(delay * 2, self.reconnect_max_delay)
+
+    async def open_session(
+        self, name: str, shared_space: Optional[str] = None
+    ) -> Session:
+        return await self.sessions.open(name, shared_space or name)
+
+    async def close_session(self, session: Session):
+        await self.sessions.close(session)
+
+    async def close(self):
+        self._closed.set()
+        for task in (self._reconnect_task, self._watch_task):
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+        await self.sessions.close_all()
+        await self._stop_gateway()
 
     async def receive(
         self,
         callback: Coroutine,
+        session: Optional[Session] = None,
+        workers: Optional[int] = None,
+        key: Optional[Callable[[bytes], Hashable]] = None,
+        stats_interval: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        policy: str = BLOCK,
+        busy_reply: Optional[Callable[[bytes], list[bytes]]] = None,
     ):
-        # define the background task
-        async def background_task():
-            async with self.participant:
-                while True:
-                    try:
-                        # receive message from session
-                        recv_session, msg_rcv = await self.participant.receive(
-                            session=self.session_info.id
-                        )
-                        # call the callback function
-                        await callback(msg_rcv)
-                    except asyncio.CancelledError:
-                        break
-                    except Exception as e:
-                        print(f"Error receiving message: {e}")
-                        break
-
-        self.receive_task = asyncio.create_task(background_task())
-
-    async def publish(self, msg: bytes):
-        await self.participant.publish(
-            self.session_info,
-            msg,
-            self.remote_organization,
-            self.remote_namespace,
-            self.shared_space,
+        session = session or self.session
+        self.sessions.receive(
+            session,
+            callback,
+            workers=workers,
+            key=key,
+            stats_interval=stats_interval,
+            max_queue=max_queue,
+            policy=policy,
+            busy_reply=busy_reply,
         )
+
+        # the receive loop of a session is restarted on every reconnect, so
+        # the task to wait on lives until the participant is closed
+        if session is self.session and self.receive_task is None:
+            self.receive_task = asyncio.create_task(self._closed.wait())
+
+    async def publish(self, msg: bytes, session: Optional[Session] = None):
+        await self.sessions.publish(session or self.session, msg)
+
+    async def send(self, message: dict, session: Optional[Session] = None):
+        await self.publish(self.codec.encode(message), session=session)
+
+    def encode(self, message: dict) -> bytes:
+        return self.codec.encode(message)
+
+    def decode(self, msg: bytes) -> dict:
+        return self.codec.decode(msg)
+
+    async def flush(self, session: Optional[Session] = None):
+        await self.sessions.flush(session or self.session)
@@ -0,0 +1,117 @@
+import asyncio
+import struct
+from typing import Awaitable, Callable, Optional
+
+# Frames start with a NUL byte, which never starts a JSON message, so that
+# receivers can tell framed batches from plain single-message payloads.
+FRAME_MAGIC = b"\x00AGPB"
+_COUNT = struct.Struct("!H")
+_LENGTH = struct.Struct("!I")
+
+MAX_FRAME_MESSAGES = 0xFFFF
+_FRAME_HEADER_SIZE = len(FRAME_MAGIC) + _COUNT.size
+
+
+def encode_frame(messages: list[bytes]) -> bytes:
+    if len(messages) > MAX_FRAME_MESSAGES:
+        raise ValueError(f"Cannot frame more than {MAX_FRAME_MESSAGES} messages")
+
+    parts = [FRAME_MAGIC, _COUNT.pack(len(messages))]
+    for msg in messages:
+        parts.append(_LENGTH.pack(len(msg)))
+        parts.append(msg)
+    return b"".join(parts)
+
+
+def decode_frame(payload: bytes) -> list[bytes]:
+    if not payload.startswith(FRAME_MAGIC):
+        return [payload]
+
+    view = memoryview(payload)
+    offset = len(FRAME_MAGIC)
+    (count,) = _COUNT.unpack_from(view, offset)
+    offset += _COUNT.size
+
+    messages = []
+    for _ in range(count):
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        if offset + length > len(view):
+            raise ValueError("Truncated AGP frame")
+        messages.append(bytes(view[offset : offset + length]))
+        offset += length
+    return messages
+
+
+class BatchPublisher:
+    """Coalesces outgoing messages published within a time and size window
+    into a single framed gateway payload."""
+
+    def __init__(
+        self,
+        send: Callable[[bytes], Awaitable[None]],
+        window: float,
+        max_messages: int = 32,
+        max_bytes: int = 64 * 1024,
+    ):
+        self.send = send
+        self.window = window
+        self.max_messages = min(max_messages, MAX_FRAME_MESSAGES)
+        self.max_bytes = max_bytes
+
+        self.pending: list[bytes] = []
+        self.pending_bytes = 0
+        self._timer: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        # counters
+        self.messages_sent = 0
+        self.payloads_sent = 0
+
+    async def publish(self, msg: bytes):
+        # flush first when the message would push the frame past max_bytes,
+        # a message larger than that on its own goes out alone
+        size = _LENGTH.size + len(msg)
+        if self.pending and _FRAME_HEADER_SIZE + self.pending_bytes + size > self.max_bytes:
+            await self.flush()
+
+        self.pending.append(msg)
+        self.pending_bytes += size
+
+        if (
+            len(self.pending) >= self.max_messages
+            or _FRAME_HEADER_SIZE + self.pending_bytes >= self.max_bytes
+        ):
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error publishing batch: {e}")
+
+    async def flush(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+            self._timer = None
+
+        # the lock keeps batches in publish order when a size-triggered flush
+        # races with a timer-triggered one
+        async with self._lock:
+            if not self.pending:
+                return
+            messages, self.pending, self.pending_bytes = self.pending, [], 0
+
+            # a lone message goes out unframed, exactly as without batching
+            payload = messages[0] if len(messages) == 1 else encode_frame(messages)
+            await self.send(payload)
+
+            self.messages_sent += len(messages)
+            self.payloads_sent += 1
+
+    async def close(self):
+        await self.flush()
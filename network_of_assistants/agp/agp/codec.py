@@ -0,0 +1,165 @@
+import json
+import struct
+import sys
+
+# The first byte of a binary payload is the codec version. JSON payloads start
+# with "{" and batch frames with a NUL byte, so the three never collide and
+# decoding works whatever the sender used. Version 2 appends the optional
+# fields to the layout, messages without them are still sent as version 1.
+BINARY_VERSION = 0x01
+BINARY_VERSION_OPTIONAL = 0x02
+BINARY_VERSIONS = (BINARY_VERSION, BINARY_VERSION_OPTIONAL)
+
+CHAT_MESSAGE = 0x01
+REQUEST_TO_SPEAK = 0x02
+INVITE_TO_CHAT = 0x03
+
+# field layout of each message type, "id" fields are agent ids that are
+# interned, "text" fields are length-prefixed UTF-8 strings
+SCHEMAS = {
+    "ChatMessage": (CHAT_MESSAGE, (("author", "id"), ("message", "text"))),
+    "RequestToSpeak": (REQUEST_TO_SPEAK, (("author", "id"), ("target", "id"))),
+    "InviteToChat": (
+        INVITE_TO_CHAT,
+        (("author", "id"), ("target", "id"), ("summary", "text")),
+    ),
+}
+TYPES = {tag: (name, fields) for name, (tag, fields) in SCHEMAS.items()}
+
+# fields any message type may carry, "key" fields are strings of at most 255
+# bytes with a one-byte length
+OPTIONAL_FIELDS = (("conversation_id", "key"),)
+
+# agent ids known to every participant are sent as a single byte, any other
+# id is sent inline after the INLINE_ID marker. The table is part of the wire
+# format: only ever append to it, together with a version bump.
+INTERNED_IDS = ("moderator", "user-proxy")
+INLINE_ID = 0xFF
+
+_ID_INDEX = {agent_id: index for index, agent_id in enumerate(INTERNED_IDS)}
+_HEADER = struct.Struct("!BB")
+_TEXT_LENGTH = struct.Struct("!I")
+
+
+class JsonCodec:
+    name = "json"
+
+    def encode(self, message: dict) -> bytes:
+        return json.dumps(message).encode("utf-8")
+
+    def decode(self, payload: bytes) -> dict:
+        return decode(payload)
+
+
+class BinaryCodec:
+    name = "binary"
+
+    def encode(self, message: dict) -> bytes:
+        schema = SCHEMAS.get(message.get("type"))
+        if schema is None:
+            return JsonCodec().encode(message)
+
+        tag, fields = schema
+        optional = [field for field in OPTIONAL_FIELDS if field[0] in message]
+        # the type, the fields of the schema and the optional ones present
+        if len(message) != 1 + len(fields) + len(optional):
+            # fields outside the schema only survive the JSON encoding
+            return JsonCodec().encode(message)
+
+        version = BINARY_VERSION
+        if optional:
+            version = BINARY_VERSION_OPTIONAL
+            fields = fields + OPTIONAL_FIELDS
+
+        parts = [_HEADER.pack(version, tag)]
+        for field, kind in fields:
+            value = message.get(field)
+            if kind == "key":
+                if value is None:
+                    parts.append(b"\x00")
+                    continue
+                if not isinstance(value, str) or not value:
+                    return JsonCodec().encode(message)
+                data = value.encode("utf-8")
+                if len(data) > 0xFF:
+                    return JsonCodec().encode(message)
+                parts.append(bytes((len(data),)))
+                parts.append(data)
+                continue
+            if not isinstance(value, str):
+                return JsonCodec().encode(message)
+            if kind == "id":
+                index = _ID_INDEX.get(value)
+                if index is not None:
+                    parts.append(bytes((index,)))
+                    continue
+                data = value.encode("utf-8")
+                if len(data) > 0xFF:
+                    return JsonCodec().encode(message)
+                parts.append(bytes((INLINE_ID, len(data))))
+                parts.append(data)
+            else:
+                data = value.encode("utf-8")
+                parts.append(_TEXT_LENGTH.pack(len(data)))
+                parts.append(data)
+        return b"".join(parts)
+
+    def decode(self, payload: bytes) -> dict:
+        return decode(payload)
+
+
+def _decode_binary(payload: bytes) -> dict:
+    version, tag = _HEADER.unpack_from(payload, 0)
+    if version not in BINARY_VERSIONS:
+        raise ValueError(f"Unsupported codec version {version}")
+    if tag not in TYPES:
+        raise ValueError(f"Unknown message type tag {tag}")
+
+    name, fields = TYPES[tag]
+    if version == BINARY_VERSION_OPTIONAL:
+        fields = fields + OPTIONAL_FIELDS
+    message = {"type": name}
+    offset = _HEADER.size
+    for field, kind in fields:
+        if kind == "key":
+            length = payload[offset]
+            offset += 1
+            if not length:
+                continue
+            value = payload[offset : offset + length].decode("utf-8")
+            offset += length
+        elif kind == "id":
+            index = payload[offset]
+            offset += 1
+            if index == INLINE_ID:
+                length = payload[offset]
+                offset += 1
+                value = sys.intern(payload[offset : offset + length].decode("utf-8"))
+                offset += length
+            else:
+                value = INTERNED_IDS[index]
+        else:
+            (length,) = _TEXT_LENGTH.unpack_from(payload, offset)
+            offset += _TEXT_LENGTH.size
+            value = payload[offset : offset + length].decode("utf-8")
+            offset += length
+        message[field] = value
+
+    if offset != len(payload):
+        raise ValueError("Malformed binary message")
+    return message
+
+
+def decode(payload: bytes) -> dict:
+    if payload[:1] and payload[0] in BINARY_VERSIONS:
+        return _decode_binary(payload)
+    return json.loads(payload.decode("utf-8"))
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec, BinaryCodec)}
+
+
+def get_codec(name: str):
+    if name not in CODECS:
+        raise ValueError(f"Codec must be one of {', '.join(CODECS)}")
+    return CODECS[name]()
@@ -0,0 +1,89 @@
+import collections
+import time
+import zlib
+from typing import Any, Callable, Optional
+
+# conversation of the messages that carry no conversation_id
+DEFAULT_CONVERSATION = "default"
+
+
+class ConversationStore:
+    """State of every active conversation, made by factory from the
+    conversation id and spread over shards by a hash of that id. Each shard
+    is kept in order of last activity. Conversations idle for longer than
+    idle_ttl seconds are evicted: every lookup sweeps at most one shard, so
+    eviction cost stays flat however many conversations are open. Past
+    max_conversations, the least recently active one is evicted."""
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        shards: int = 16,
+        idle_ttl: Optional[float] = 1800.0,
+        max_conversations: Optional[int] = None,
+    ):
+        self.factory = factory
+        self.idle_ttl = idle_ttl
+        self.max_conversations = max_conversations
+        # conversation id -> (last activity, conversation)
+        self.shards: list[collections.OrderedDict[str, tuple[float, Any]]] = [
+            collections.OrderedDict() for _ in range(shards)
+        ]
+        self._next_sweep = 0
+
+        # counters
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+    def _shard(self, conversation_id: str) -> collections.OrderedDict:
+        return self.shards[zlib.crc32(conversation_id.encode("utf-8")) % len(self.shards)]
+
+    def get(self, conversation_id: Optional[str]) -> Any:
+        conversation_id = conversation_id or DEFAULT_CONVERSATION
+        self.sweep()
+
+        shard = self._shard(conversation_id)
+        entry = shard.pop(conversation_id, None)
+        if entry is None:
+            if self.max_conversations and len(self) >= self.max_conversations:
+                self._evict_oldest()
+            conversation = self.factory(conversation_id)
+            self.created += 1
+        else:
+            conversation = entry[1]
+        shard[conversation_id] = (time.monotonic(), conversation)
+        return conversation
+
+    def sweep(self, now: Optional[float] = None):
+        # expire idle conversations of the next shard, round robin
+        if not self.idle_ttl:
+            return
+        now = time.monotonic() if now is None else now
+        shard = self.shards[self._next_sweep]
+        self._next_sweep = (self._next_sweep + 1) % len(self.shards)
+        while shard:
+            conversation_id, (last_active, _) = next(iter(shard.items()))
+            if now - last_active <= self.idle_ttl:
+                break
+            del shard[conversation_id]
+            self.expired += 1
+
+    def _evict_oldest(self):
+        # the oldest conversation of every shard comes first in it
+        shards = [shard for shard in self.shards if shard]
+        if shards:
+            oldest = min(shards, key=lambda shard: next(iter(shard.values()))[0])
+            oldest.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,193 @@
+import asyncio
+import collections
+import time
+from typing import Callable, Coroutine, Hashable, Optional
+
+from .codec import decode
+from .stats import percentile
+
+# what to do with a message that arrives while the inbound queue is full
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+DROP_NEWEST = "drop-newest"
+REPLY_BUSY = "reply-busy"
+OVERLOAD_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, REPLY_BUSY)
+
+
+def message_key(msg: bytes) -> Hashable:
+    # order messages within a conversation, falling back to the author
+    try:
+        data = decode(msg)
+    except (ValueError, IndexError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return data.get("conversation_id") or data.get("author")
+
+
+class Dispatcher:
+    """Runs a receive callback on a bounded pool of workers. Messages that
+    share a key are handled one at a time and in arrival order, messages
+    with different keys are handled in parallel. With max_queue set, at most
+    that many messages wait for a worker and the overload policy decides what
+    happens to the rest."""
+
+    def __init__(
+        self,
+        callback: Coroutine,
+        workers: int = 4,
+        key: Optional[Callable[[bytes], Hashable]] = None,
+        latency_window: int = 1024,
+        log_interval: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        policy: str = BLOCK,
+        on_busy: Optional[Coroutine] = None,
+    ):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(
+                f"Overload policy must be one of {', '.join(OVERLOAD_POLICIES)}"
+            )
+
+        self.callback = callback
+        self.workers = workers
+        self.key = key or message_key
+        self.log_interval = log_interval
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_busy = on_busy
+
+        # per key FIFO of (enqueue time, message), and the keys that have
+        # messages waiting and no worker currently handling them
+        self._pending: dict[Hashable, collections.deque] = {}
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._not_full = asyncio.Event()
+
+        # statistics
+        self.depth = 0
+        self.max_depth = 0
+        self.handled = 0
+        self.errors = 0
+        self.blocked = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.busy_replies = 0
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._waits = collections.deque(maxlen=latency_window)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        if self.log_interval:
+            self._tasks.append(asyncio.create_task(self._log_stats()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, msg: bytes):
+        if self.max_queue and self.depth >= self.max_queue:
+            if self.policy == BLOCK:
+                # stop reading from the gateway until a worker frees a slot
+                self.blocked += 1
+                while self.depth >= self.max_queue:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+            elif self.policy == DROP_OLDEST:
+                self._drop_oldest()
+            elif self.policy == DROP_NEWEST:
+                self.dropped_newest += 1
+                return
+            elif self.policy == REPLY_BUSY:
+                self.busy_replies += 1
+                if self.on_busy is not None:
+                    try:
+                        await self.on_busy(msg)
+                    except Exception as e:
+                        print(f"Error replying busy: {e}")
+                return
+
+        key = self.key(msg)
+        queue = self._pending.get(key)
+        if queue is None:
+            # nobody is handling this key, so it becomes ready right away
+            queue = self._pending[key] = collections.deque()
+            self._ready.put_nowait(key)
+        queue.append((time.monotonic(), msg))
+
+        self.depth += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def _drop_oldest(self):
+        key, queue = min(
+            ((key, queue) for key, queue in self._pending.items() if queue),
+            key=lambda item: item[1][0][0],
+        )
+        queue.popleft()
+        self.depth -= 1
+        self.dropped_oldest += 1
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            if not queue:
+                # every message waiting on this key was shed
+                del self._pending[key]
+                continue
+            enqueued, msg = queue.popleft()
+            self.depth -= 1
+            self._not_full.set()
+
+            start = time.monotonic()
+            self._waits.append(start - enqueued)
+            try:
+                await self.callback(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Error handling message: {e}")
+            finally:
+                self._latencies.append(time.monotonic() - start)
+                self.handled += 1
+
+                # hand the key back only once its previous message is done
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            print(f"Dispatcher stats: {self.stats()}")
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        waits = sorted(self._waits)
+        return {
+            "workers": self.workers,
+            "queue_depth": self.depth,
+            "max_queue_depth": self.max_depth,
+            "active_keys": len(self._pending),
+            "handled": self.handled,
+            "errors": self.errors,
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "shed": self.dropped_oldest + self.dropped_newest + self.busy_replies,
+            "blocked": self.blocked,
+            "dropped_oldest": self.dropped_oldest,
+            "dropped_newest": self.dropped_newest,
+            "busy_replies": self.busy_replies,
+            "handler_latency_p50": percentile(latencies, 0.50),
+            "handler_latency_p95": percentile(latencies, 0.95),
+            "handler_latency_max": latencies[-1] if latencies else 0.0,
+            "queue_wait_p50": percentile(waits, 0.50),
+            "queue_wait_p95": percentile(waits, 0.95),
+        }
@@ -0,0 +1,256 @@
+import asyncio
+import collections
+import random
+import zlib
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# In-process stand-in for the subset of agp_bindings.Gateway used by the AGP
+# wrapper, so that a whole network of assistants can run in one process.
+# Select it with an endpoint like loopback://noa?latency_ms=2&jitter_ms=1&loss=0.01
+SCHEME = "loopback://"
+
+SESSION_UNSPECIFIED = 0
+
+
+def is_loopback(endpoint: str) -> bool:
+    return endpoint.startswith(SCHEME)
+
+
+def _name(organization: str, namespace: str, agent: str) -> tuple[str, str, str]:
+    return (organization, namespace, agent)
+
+
+class SessionInfo:
+    def __init__(self, session_id: int):
+        self.id = session_id
+
+    def __repr__(self):
+        return f"SessionInfo(id={self.id})"
+
+
+class Hub:
+    """Fans published messages out to every other gateway subscribed to the
+    destination, after the configured latency and subject to the configured
+    loss rate."""
+
+    hubs: dict[str, "Hub"] = {}
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+
+        self.subscriptions: dict[tuple[str, str, str], set["Gateway"]] = {}
+
+        # counters
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    @classmethod
+    def get(cls, endpoint: str) -> "Hub":
+        # gateways configured with the same endpoint share a hub, the first
+        # one to connect decides its latency and loss
+        url = urlparse(endpoint)
+        if url.netloc not in cls.hubs:
+            params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            cls.hubs[url.netloc] = cls(
+                latency=float(params.get("latency_ms", 0)) / 1000,
+                jitter=float(params.get("jitter_ms", 0)) / 1000,
+                loss=float(params.get("loss", 0)),
+                seed=int(params["seed"]) if "seed" in params else None,
+            )
+        return cls.hubs[url.netloc]
+
+    @classmethod
+    def reset(cls):
+        cls.hubs.clear()
+
+    def subscribe(self, name: tuple[str, str, str], gateway: "Gateway"):
+        self.subscriptions.setdefault(name, set()).add(gateway)
+
+    def unsubscribe(self, name: tuple[str, str, str], gateway: "Gateway"):
+        subscribers = self.subscriptions.get(name)
+        if subscribers is not None:
+            subscribers.discard(gateway)
+            if not subscribers:
+                del self.subscriptions[name]
+
+    def publish(self, sender: "Gateway", name: tuple[str, str, str], msg: bytes):
+        self.published += 1
+        loop = asyncio.get_running_loop()
+        for gateway in list(self.subscriptions.get(name, ())):
+            # like the real gateway, never echo a message back to its sender
+            if gateway is sender:
+                continue
+            if self.loss and self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+
+            delay = self.latency
+            if self.jitter:
+                delay += self.random.uniform(0, self.jitter)
+
+            # keep per receiver ordering even when jitter would reorder: every
+            # scheduled callback delivers the oldest message still in flight
+            deliver_at = max(loop.time() + delay, gateway.last_delivery)
+            gateway.last_delivery = deliver_at
+            gateway.in_flight.append((name, msg))
+            loop.call_at(deliver_at, gateway.deliver_next)
+
+    def stats(self) -> dict:
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+class Gateway:
+    def __init__(self, organization: str, namespace: str, agent: str):
+        self.local_name = _name(organization, namespace, agent)
+        self.hub: Optional[Hub] = None
+        self.connected = False
+        self.routes: set[tuple[str, str, str]] = set()
+        self.subscriptions: set[tuple[str, str, str]] = set()
+        self.last_delivery = 0.0
+        self.in_flight: collections.deque = collections.deque()
+
+        # the same sessions map as agp_bindings.Gateway, which the wrapper
+        # relies on to drop sessions
+        self.sessions: dict[int, tuple[Optional[SessionInfo], asyncio.Queue]] = {
+            SESSION_UNSPECIFIED: (None, asyncio.Queue()),
+        }
+        self._topics: dict[tuple[str, str, str], int] = {}
+        self._failure: asyncio.Future = None
+
+    async def __aenter__(self):
+        self._failure = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self._receive_loop())
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+    async def _receive_loop(self):
+        # messages are delivered straight into the session queues, the loop
+        # only exists to report injected failures like the real one does
+        await self._failure
+
+    @classmethod
+    async def new(
+        cls,
+        organization: str,
+        namespace: str,
+        agent: str,
+        id: Optional[int] = None,
+    ) -> "Gateway":
+        return cls(organization, namespace, agent)
+
+    def configure(self, config):
+        self.hub = Hub.get(config.endpoint)
+
+    async def connect(self) -> int:
+        self.connected = True
+        self.hub.subscribe(self.local_name, self)
+        self.subscriptions.add(self.local_name)
+        return id(self)
+
+    async def disconnect(self):
+        for name in self.subscriptions:
+            self.hub.unsubscribe(name, self)
+        self.subscriptions.clear()
+        self.routes.clear()
+        self.connected = False
+
+    def fail(self, e: Optional[Exception] = None):
+        # simulate a lost connection: the receive loop dies and publishing fails
+        e = e or ConnectionError("loopback connection lost")
+        self.connected = False
+        if self._failure is not None and not self._failure.done():
+            self._failure.set_exception(e)
+
+    async def set_route(
+        self, organization: str, namespace: str, agent: str, id: Optional[int] = None
+    ):
+        self.routes.add(_name(organization, namespace, agent))
+
+    async def remove_route(
+        self, organization: str, namespace: str, agent: str, id: Optional[int] = None
+    ):
+        self.routes.discard(_name(organization, namespace, agent))
+
+    async def subscribe(
+        self, organization: str, namespace: str, agent: str, id: Optional[int] = None
+    ):
+        name = _name(organization, namespace, agent)
+        self.subscriptions.add(name)
+        self.hub.subscribe(name, self)
+
+    async def unsubscribe(
+        self, organization: str, namespace: str, agent: str, id: Optional[int] = None
+    ):
+        name = _name(organization, namespace, agent)
+        self.subscriptions.discard(name)
+        self.hub.unsubscribe(name, self)
+
+    async def create_streaming_session(self, session_config, queue_size: int = 0):
+        topic = session_config.topic
+        name = _name(topic.organization, topic.namespace, topic.agent_type)
+
+        # like the real gateway, the id of a streaming session only depends
+        # on its topic, so all participants of a shared space agree on it
+        session = SessionInfo(zlib.crc32("/".join(name).encode("utf-8")))
+        self.sessions[session.id] = (session, asyncio.Queue(queue_size))
+        self._topics[name] = session.id
+        return session
+
+    async def publish(
+        self,
+        session: SessionInfo,
+        msg: bytes,
+        organization: str,
+        namespace: str,
+        agent: str,
+        id: Optional[int] = None,
+    ):
+        if not self.connected:
+            raise ConnectionError("loopback gateway is not connected")
+        name = _name(organization, namespace, agent)
+        if name not in self.routes and name not in self.hub.subscriptions:
+            raise Exception(f"no route for {'/'.join(name)}")
+        self.hub.publish(self, name, msg)
+
+    def deliver_next(self):
+        name, msg = self.in_flight.popleft()
+        if not self.connected:
+            self.hub.dropped += 1
+            return
+
+        session_id = self._topics.get(name, SESSION_UNSPECIFIED)
+        if session_id not in self.sessions:
+            session_id = SESSION_UNSPECIFIED
+        session, queue = self.sessions[session_id]
+        queue.put_nowait((session or SessionInfo(session_id), msg))
+        self.hub.delivered += 1
+
+    async def receive(
+        self, session: Optional[int] = None
+    ) -> tuple[SessionInfo, Optional[bytes]]:
+        if session is None:
+            return await self.sessions[SESSION_UNSPECIFIED][1].get()
+        if session not in self.sessions:
+            raise Exception("Session ID not found")
+        return await self.sessions[session][1].get()
@@ -0,0 +1,319 @@
+import asyncio
+import collections
+import datetime
+from typing import Callable, Coroutine, Hashable, Optional
+
+import agp_bindings
+
+from .batching import BatchPublisher, decode_frame
+from .dispatch import BLOCK, Dispatcher
+
+
+class Session:
+    def __init__(self, name: str, shared_space: str, info: agp_bindings.PySessionInfo):
+        self.name = name
+        self.shared_space = shared_space
+        self.info = info
+        self.receive_task: Optional[asyncio.Task] = None
+        self.publisher: Optional[BatchPublisher] = None
+        self.dispatcher: Optional[Dispatcher] = None
+        self.callback: Optional[Coroutine] = None
+
+    @property
+    def id(self) -> int:
+        return self.info.id
+
+    def __repr__(self):
+        return f"Session(name={self.name!r}, shared_space={self.shared_space!r}, id={self.id})"
+
+
+class SessionManager:
+    """Opens, tracks and tears down many named streaming sessions over a
+    single gateway connection, one per shared space."""
+
+    def __init__(
+        self,
+        participant: agp_bindings.Gateway,
+        organization: str,
+        namespace: str,
+        max_retries: int = 5,
+        timeout: datetime.timedelta = datetime.timedelta(seconds=5),
+        batch_window: Optional[float] = None,
+        batch_max_messages: int = 32,
+        batch_max_bytes: int = 64 * 1024,
+        replay_buffer_size: int = 1024,
+    ):
+        self.participant = participant
+        self.organization = organization
+        self.namespace = namespace
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        # batching is opt-in: without a window every publish is one gateway publish
+        self.batch_window = batch_window
+        self.batch_max_messages = batch_max_messages
+        self.batch_max_bytes = batch_max_bytes
+
+        self.sessions: dict[str, Session] = {}
+        self.sessions_by_id: dict[int, Session] = {}
+
+        # the gateway derives the session id from the shared space and keeps
+        # one inbound queue per id, so each shared space has one session
+        self.sessions_by_space: dict[str, Session] = {}
+
+        # outbound messages the gateway has not accepted yet, replayed in
+        # order once the connection is restored
+        self.connected = True
+        self.on_failure: Optional[Callable[[Exception], None]] = None
+        self.replay_buffer: collections.deque = collections.deque(
+            maxlen=replay_buffer_size
+        )
+        self.replayed = 0
+        self.replay_dropped = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def __contains__(self, name: str):
+        return name in self.sessions
+
+    def get(self, name: str) -> Session:
+        return self.sessions[name]
+
+    def by_id(self, session_id: int) -> Optional[Session]:
+        return self.sessions_by_id.get(session_id)
+
+    async def open(self, name: str, shared_space: str) -> Session:
+        if name in self.sessions:
+            raise ValueError(f"Session {name} is already open")
+        if shared_space in self.sessions_by_space:
+            raise ValueError(
+                f"Shared space {shared_space} is already open as session "
+                f"{self.sessions_by_space[shared_space].name}"
+            )
+
+        await self._join(shared_space)
+        info = await self._create_streaming_session(shared_space)
+
+        session = Session(name, shared_space, info)
+        if self.batch_window:
+            session.publisher = BatchPublisher(
+                lambda payload: self._send(session, payload),
+                window=self.batch_window,
+                max_messages=self.batch_max_messages,
+                max_bytes=self.batch_max_bytes,
+            )
+        self.sessions[name] = session
+        self.sessions_by_id[session.id] = session
+        self.sessions_by_space[shared_space] = session
+        return session
+
+    async def _join(self, shared_space: str):
+        # set route for the shared space, so that messages can be sent to the other participants
+        await self.participant.set_route(
+            self.organization, self.namespace, shared_space
+        )
+        # Subscribe to the shared space
+        await self.participant.subscribe(
+            self.organization, self.namespace, shared_space
+        )
+
+    async def _create_streaming_session(
+        self, shared_space: str
+    ) -> agp_bindings.PySessionInfo:
+        # create pubsub session. A pubsub session is a just a bidirectional
+        # streaming session, where participants are both sender and receivers
+        return await self.participant.create_streaming_session(
+            agp_bindings.PyStreamingConfiguration(
+                agp_bindings.PySessionDirection.BIDIRECTIONAL,
+                topic=agp_bindings.PyAgentType(
+                    self.organization, self.namespace, shared_space
+                ),
+                max_retries=self.max_retries,
+                timeout=self.timeout,
+            )
+        )
+
+    async def restore(self, participant: agp_bindings.Gateway):
+        # re-create routes, subscriptions and sessions on a new gateway.
+        # Session handles stay valid, only their session info is replaced.
+        self.participant = participant
+        for session in self:
+            await self._join(session.shared_space)
+            self.sessions_by_id.pop(session.id, None)
+            session.info = await self._create_streaming_session(session.shared_space)
+            self.sessions_by_id[session.id] = session
+
+            # the new session comes with a new gateway queue, so the receive
+            # loop has to be restarted on it
+            if session.callback is not None:
+                await self._stop_receiving(session)
+                self._start_receiving(session)
+
+        self.connected = True
+
+    async def replay(self):
+        while self.replay_buffer and self.connected:
+            session, msg = self.replay_buffer.popleft()
+            if self.sessions.get(session.name) is not session:
+                continue
+            if await self._deliver(session, msg):
+                self.replayed += 1
+
+    async def close(self, session: Session):
+        if self.sessions.get(session.name) is not session:
+            return
+
+        await self._stop_receiving(session)
+        session.callback = None
+
+        if session.dispatcher is not None:
+            await session.dispatcher.stop()
+            session.dispatcher = None
+
+        if session.publisher is not None:
+            await session.publisher.close()
+
+        del self.sessions[session.name]
+        del self.sessions_by_space[session.shared_space]
+        self.sessions_by_id.pop(session.id, None)
+
+        # the gateway keeps one inbound queue per session and has no API to
+        # drop it, so remove it here to stop buffering messages nobody reads
+        self.participant.sessions.pop(session.id, None)
+
+        await self.participant.unsubscribe(
+            self.organization, self.namespace, session.shared_space
+        )
+        await self.participant.remove_route(
+            self.organization, self.namespace, session.shared_space
+        )
+
+    async def close_all(self):
+        for session in self:
+            await self.close(session)
+
+    def receive(
+        self,
+        session: Session,
+        callback: Coroutine,
+        workers: Optional[int] = None,
+        key: Optional[Callable[[bytes], Hashable]] = None,
+        stats_interval: Optional[float] = None,
+        max_queue: Optional[int] = None,
+        policy: str = BLOCK,
+        busy_reply: Optional[Callable[[bytes], list[bytes]]] = None,
+    ) -> asyncio.Task:
+        if session.callback is not None:
+            raise ValueError(f"Session {session.name} is already receiving")
+
+        # bounding the inbound queue needs the messages to be buffered
+        # outside the gateway, which is what the dispatcher does
+        if max_queue and not workers:
+            workers = 1
+
+        async def on_busy(msg: bytes):
+            for reply in busy_reply(msg) if busy_reply else []:
+                await self.publish(session, reply)
+
+        if workers:
+            # hand messages over to a worker pool so that a slow callback
+            # does not stall the receive loop
+            session.dispatcher = Dispatcher(
+                callback,
+                workers=workers,
+                key=key,
+                log_interval=stats_interval,
+                max_queue=max_queue,
+                policy=policy,
+                on_busy=on_busy,
+            )
+            session.dispatcher.start()
+            callback = session.dispatcher.submit
+
+        session.callback = callback
+        return self._start_receiving(session)
+
+    def _start_receiving(self, session: Session) -> asyncio.Task:
+        # the gateway demultiplexes incoming messages into one queue per
+        # session id, so every session gets its own receive loop
+        async def session_task():
+            while True:
+                try:
+                    recv_session, msg_rcv = await self.participant.receive(
+                        session=session.id
+                    )
+                    # a payload may carry a batch of messages coalesced by the sender
+                    for msg in decode_frame(msg_rcv):
+                        await session.callback(msg)
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    print(f"Error receiving message on session {session.name}: {e}")
+                    self.fail(e)
+                    break
+
+        session.receive_task = asyncio.create_task(session_task())
+        return session.receive_task
+
+    async def _stop_receiving(self, session: Session):
+        task, session.receive_task = session.receive_task, None
+        if task is None or task is asyncio.current_task():
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def fail(self, e: Exception):
+        if self.on_failure is not None:
+            self.connected = False
+            self.on_failure(e)
+
+    async def publish(self, session: Session, msg: bytes):
+        if session.publisher is not None:
+            await session.publisher.publish(msg)
+        else:
+            await self._send(session, msg)
+
+    async def flush(self, session: Session):
+        if session.publisher is not None:
+            await session.publisher.flush()
+
+    async def _send(self, session: Session, msg: bytes):
+        # while disconnected, keep the order by queueing behind the backlog
+        if not self.connected or self.replay_buffer:
+            self._buffer(session, msg)
+        else:
+            await self._deliver(session, msg)
+
+    async def _deliver(self, session: Session, msg: bytes) -> bool:
+        try:
+            await self.participant.publish(
+                session.info,
+                msg,
+                self.organization,
+                self.namespace,
+                session.shared_space,
+            )
+            return True
+        except Exception as e:
+            if self.on_failure is None:
+                raise
+            print(f"Error publishing message on session {session.name}: {e}")
+            # back at the head of the backlog, on a full buffer that pushes
+            # out the newest message
+            if len(self.replay_buffer) == self.replay_buffer.maxlen:
+                self.replay_dropped += 1
+            self.replay_buffer.appendleft((session, msg))
+            self.fail(e)
+            return False
+
+    def _buffer(self, session: Session, msg: bytes):
+        if len(self.replay_buffer) == self.replay_buffer.maxlen:
+            self.replay_dropped += 1
+        self.replay_buffer.append((session, msg))
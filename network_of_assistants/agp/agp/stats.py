@@ -0,0 +1,6 @@
+def percentile(sorted_values: list[float], q: float) -> float:
+    # nearest-rank percentile of already sorted values
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
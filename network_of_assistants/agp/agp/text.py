@@ -0,0 +1,13 @@
+import re
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize(text: str) -> str:
+    # case, punctuation and spacing do not change what a message asks
+    return " ".join(_PUNCTUATION.sub(" ", text.lower()).split())
+
+
+def count_tokens(text: str) -> int:
+    # close enough to BPE token counts for budgeting, without a tokenizer
+    return len(text) // 4 + 1
@@ -0,0 +1,79 @@
+import argparse
+import json
+import timeit
+
+from agp.codec import BinaryCodec, decode
+
+MESSAGES = [
+    {
+        "type": "ChatMessage",
+        "author": "user-proxy",
+        "message": "How do I configure a VLAN on a Nexus 9000 switch?",
+    },
+    {
+        "type": "InviteToChat",
+        "author": "moderator",
+        "target": "nexus-assistant",
+        "summary": "The user wants to know how to configure a VLAN on a Nexus 9000 switch.",
+    },
+    {"type": "RequestToSpeak", "author": "moderator", "target": "nexus-assistant"},
+    {
+        "type": "ChatMessage",
+        "author": "nexus-assistant",
+        "message": "Enter configuration mode with `configure terminal`, then run "
+        "`vlan 10` and `name engineering`. " * 4,
+    },
+    {"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"},
+]
+
+
+def json_encode(message):
+    return json.dumps(message).encode("utf-8")
+
+
+def json_decode(payload):
+    return json.loads(payload.decode("utf-8"))
+
+
+def bench(fn, args, number):
+    def run():
+        for arg in args:
+            fn(arg)
+
+    best = min(timeit.repeat(run, number=number, repeat=5))
+    return best / (number * len(args)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the NoA wire codecs.")
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    binary = BinaryCodec()
+    json_payloads = [json_encode(m) for m in MESSAGES]
+    binary_payloads = [binary.encode(m) for m in MESSAGES]
+    assert [decode(p) for p in binary_payloads] == MESSAGES
+
+    results = {
+        "json": {
+            "bytes": sum(map(len, json_payloads)),
+            "encode_us": bench(json_encode, MESSAGES, args.number),
+            "decode_us": bench(json_decode, json_payloads, args.number),
+        },
+        "binary": {
+            "bytes": sum(map(len, binary_payloads)),
+            "encode_us": bench(binary.encode, MESSAGES, args.number),
+            "decode_us": bench(decode, binary_payloads, args.number),
+        },
+    }
+
+    print(f"{'codec':<8} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<8} {result['bytes']:>8} "
+            f"{result['encode_us']:>10.2f} {result['decode_us']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from agp import AGP
 
 
-def on_message_received(message: bytes):
+async def on_message_received(message: bytes):
     # Decode the message from bytes to string
     decoded_message = message.decode("utf-8")
     print(f"Received message: {decoded_message}")
@@ -23,6 +23,13 @@ async def main():
     # Publish a message to the AGP server
     await agp.publish(msg="Hello, this is a test message!".encode("utf-8"))
 
+    # Open a second session on another shared space over the same connection
+    session = await agp.open_session("another-chat")
+    await agp.receive(callback=on_message_received, session=session)
+    await agp.publish(msg="Hello from another chat!".encode("utf-8"), session=session)
+
+    await agp.close_session(session)
+
 
 if __name__ == "__main__":
     import asyncio
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from agp.batching import BatchPublisher, decode_frame, encode_frame
+
+
+def test_frame_round_trip():
+    messages = [b"{}", b"", b"\x01\x02" * 100]
+    assert decode_frame(encode_frame(messages)) == messages
+
+
+def test_plain_payload_is_one_message():
+    assert decode_frame(b'{"type": "ChatMessage"}') == [b'{"type": "ChatMessage"}']
+
+
+def test_truncated_frame():
+    with pytest.raises(ValueError):
+        decode_frame(encode_frame([b"abcdef"])[:-1])
+
+
+def publish_all(messages, **kwargs) -> list[bytes]:
+    async def scenario():
+        payloads = []
+
+        async def send(payload: bytes):
+            payloads.append(payload)
+
+        publisher = BatchPublisher(send, window=10.0, **kwargs)
+        for msg in messages:
+            await publisher.publish(msg)
+        await publisher.close()
+        return payloads
+
+    return asyncio.run(scenario())
+
+
+def test_lone_message_is_sent_unframed():
+    assert publish_all([b"hello"]) == [b"hello"]
+
+
+def test_batches_up_to_max_messages():
+    payloads = publish_all([b"m%d" % i for i in range(5)], max_messages=2)
+    assert [decode_frame(payload) for payload in payloads] == [
+        [b"m0", b"m1"],
+        [b"m2", b"m3"],
+        [b"m4"],
+    ]
+
+
+def test_frames_never_exceed_max_bytes():
+    messages = [bytes([i]) * 40 for i in range(10)]
+    payloads = publish_all(messages, max_bytes=100)
+    assert all(len(payload) <= 100 for payload in payloads)
+    assert [msg for payload in payloads for msg in decode_frame(payload)] == messages
+
+
+def test_oversized_message_goes_out_alone():
+    payloads = publish_all([b"a" * 10, b"b" * 500, b"c" * 10], max_bytes=100)
+    assert payloads[1] == b"b" * 500
+    assert [msg for payload in payloads for msg in decode_frame(payload)] == [
+        b"a" * 10,
+        b"b" * 500,
+        b"c" * 10,
+    ]
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from agp.codec import (
+    BINARY_VERSION,
+    BINARY_VERSION_OPTIONAL,
+    BinaryCodec,
+    JsonCodec,
+    decode,
+    get_codec,
+)
+
+MESSAGES = [
+    {"type": "ChatMessage", "author": "user-proxy", "message": "How do I configure a VLAN?"},
+    {"type": "RequestToSpeak", "author": "moderator", "target": "nexus-assistant"},
+    {
+        "type": "InviteToChat",
+        "author": "moderator",
+        "target": "nexus-assistant",
+        "summary": "The user wants to configure a VLAN. ✓",
+    },
+]
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_binary_v1_round_trip(message):
+    payload = BinaryCodec().encode(message)
+    assert payload[0] == BINARY_VERSION
+    assert decode(payload) == message
+
+
+@pytest.mark.parametrize("message", MESSAGES)
+def test_binary_v2_round_trip(message):
+    message = {**message, "conversation_id": "conversation-1"}
+    payload = BinaryCodec().encode(message)
+    assert payload[0] == BINARY_VERSION_OPTIONAL
+    assert decode(payload) == message
+
+
+def test_binary_is_smaller_than_json():
+    for message in MESSAGES:
+        assert len(BinaryCodec().encode(message)) < len(JsonCodec().encode(message))
+
+
+def test_interned_ids_are_one_byte():
+    message = {"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"}
+    assert BinaryCodec().encode(message) == bytes((BINARY_VERSION, 0x02, 0x00, 0x01))
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"type": "Unknown", "author": "moderator"},
+        {"type": "ChatMessage", "author": "user-proxy", "message": "hi", "extra": 1},
+        {"type": "ChatMessage", "author": "user-proxy", "message": 42},
+        {"type": "ChatMessage", "author": "user-proxy", "message": "hi", "conversation_id": ""},
+        {"type": "ChatMessage", "author": "x" * 256, "message": "hi"},
+    ],
+)
+def test_falls_back_to_json(message):
+    payload = BinaryCodec().encode(message)
+    assert payload == json.dumps(message).encode("utf-8")
+    assert decode(payload) == message
+
+
+def test_decode_rejects_unknown_tag_and_trailing_bytes():
+    with pytest.raises(ValueError):
+        decode(bytes((BINARY_VERSION, 0x7F)))
+    payload = BinaryCodec().encode(MESSAGES[1])
+    with pytest.raises(ValueError):
+        decode(payload + b"\x00")
+
+
+def test_get_codec():
+    assert isinstance(get_codec("binary"), BinaryCodec)
+    with pytest.raises(ValueError):
+        get_codec("xml")
@@ -0,0 +1,63 @@
+import time
+
+from agp.conversations import DEFAULT_CONVERSATION, ConversationStore
+
+
+class Conversation:
+    def __init__(self, conversation_id: str):
+        self.id = conversation_id
+
+
+def test_conversations_are_kept_apart():
+    store = ConversationStore(Conversation)
+    first = store.get("a")
+    assert store.get("a") is first
+    assert store.get("b") is not first
+    assert store.get(None).id == DEFAULT_CONVERSATION
+    assert len(store) == 3
+    assert store.stats()["created"] == 3
+
+
+def test_idle_conversations_expire():
+    store = ConversationStore(Conversation, shards=1, idle_ttl=60)
+    idle = store.get("idle")
+    store.get("active")
+    store.sweep(now=time.monotonic() + 61)
+    assert len(store) == 0
+    assert store.expired == 2
+
+    store.get("active")
+    store.sweep(now=time.monotonic() + 30)
+    assert len(store) == 1
+    assert store.get("idle") is not idle
+
+
+def test_sweep_visits_one_shard_per_lookup():
+    store = ConversationStore(Conversation, shards=4, idle_ttl=60)
+    for n in range(20):
+        store.get(str(n))
+    later = time.monotonic() + 61
+    for _ in range(4):
+        store.sweep(now=later)
+    assert len(store) == 0
+    assert store.expired == 20
+
+
+def test_without_idle_ttl():
+    store = ConversationStore(Conversation, idle_ttl=None)
+    store.get("a")
+    store.sweep(now=time.monotonic() + 10**6)
+    assert len(store) == 1
+
+
+def test_least_recently_active_is_evicted():
+    store = ConversationStore(Conversation, shards=4, max_conversations=2)
+    a = store.get("a")
+    store.get("b")
+    assert store.get("a") is a
+    store.get("c")
+
+    assert len(store) == 2
+    assert store.evicted == 1
+    assert store.get("a") is a
+    assert store.created == 3
@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import pytest
+
+from agp.codec import get_codec
+from agp.dispatch import (
+    BLOCK,
+    DROP_NEWEST,
+    DROP_OLDEST,
+    REPLY_BUSY,
+    Dispatcher,
+    message_key,
+)
+
+
+def message(conversation: str, n: int) -> bytes:
+    return json.dumps({"conversation_id": conversation, "n": n}).encode("utf-8")
+
+
+def test_message_key():
+    assert message_key(message("c1", 0)) == "c1"
+    assert message_key(b'{"author": "user-proxy"}') == "user-proxy"
+    assert message_key(get_codec("binary").encode({"conversation_id": "c2"})) == "c2"
+    assert message_key(b"[1, 2]") is None
+    assert message_key(b"not json") is None
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Dispatcher(None, policy="drop-everything")
+
+
+def test_messages_of_a_key_are_handled_in_order():
+    async def scenario():
+        handled = []
+        running = set()
+        overlaps = []
+
+        async def callback(msg: bytes):
+            data = json.loads(msg)
+            if data["conversation_id"] in running:
+                overlaps.append(data)
+            running.add(data["conversation_id"])
+            await asyncio.sleep(0.001 * (data["n"] % 3))
+            running.discard(data["conversation_id"])
+            handled.append((data["conversation_id"], data["n"]))
+
+        dispatcher = Dispatcher(callback, workers=4)
+        dispatcher.start()
+        for n in range(10):
+            for conversation in ("a", "b", "c"):
+                await dispatcher.submit(message(conversation, n))
+        while dispatcher.handled < 30:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return handled, overlaps, dispatcher
+
+    handled, overlaps, dispatcher = asyncio.run(scenario())
+    assert overlaps == []
+    for conversation in ("a", "b", "c"):
+        assert [n for c, n in handled if c == conversation] == list(range(10))
+    assert dispatcher.depth == 0
+    assert dispatcher.stats()["active_keys"] == 0
+
+
+def test_errors_are_counted():
+    async def scenario():
+        async def callback(msg: bytes):
+            raise RuntimeError("boom")
+
+        dispatcher = Dispatcher(callback, workers=1)
+        dispatcher.start()
+        await dispatcher.submit(message("a", 0))
+        await dispatcher.submit(message("a", 1))
+        while dispatcher.handled < 2:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return dispatcher
+
+    dispatcher = asyncio.run(scenario())
+    assert dispatcher.errors == 2
+
+
+def overload(policy: str, on_busy=None) -> tuple[list[int], Dispatcher]:
+    # nothing is handled until the queue has been filled, so every message
+    # after the first max_queue meets a full queue
+    async def scenario():
+        handled = []
+        release = asyncio.Event()
+
+        async def callback(msg: bytes):
+            await release.wait()
+            handled.append(json.loads(msg)["n"])
+
+        dispatcher = Dispatcher(
+            callback, workers=1, max_queue=2, policy=policy, on_busy=on_busy
+        )
+        for n in range(4):
+            await dispatcher.submit(message("a", n))
+        dispatcher.start()
+        release.set()
+        while dispatcher.depth:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return handled, dispatcher
+
+    return asyncio.run(scenario())
+
+
+def test_drop_newest():
+    handled, dispatcher = overload(DROP_NEWEST)
+    assert handled == [0, 1]
+    assert dispatcher.dropped_newest == 2
+    assert dispatcher.stats()["shed"] == 2
+
+
+def test_drop_oldest():
+    handled, dispatcher = overload(DROP_OLDEST)
+    assert handled == [2, 3]
+    assert dispatcher.dropped_oldest == 2
+
+
+def test_reply_busy():
+    busy = []
+
+    async def on_busy(msg: bytes):
+        busy.append(json.loads(msg)["n"])
+
+    handled, dispatcher = overload(REPLY_BUSY, on_busy)
+    assert handled == [0, 1]
+    assert busy == [2, 3]
+    assert dispatcher.busy_replies == 2
+
+
+def test_block_waits_for_a_free_slot():
+    async def scenario():
+        handled = []
+        release = asyncio.Event()
+
+        async def callback(msg: bytes):
+            await release.wait()
+            handled.append(json.loads(msg)["n"])
+
+        dispatcher = Dispatcher(callback, workers=1, max_queue=1, policy=BLOCK)
+        dispatcher.start()
+        # the worker takes the first message, the second fills the queue
+        await dispatcher.submit(message("a", 0))
+        await asyncio.sleep(0)
+        await dispatcher.submit(message("a", 1))
+
+        blocked = asyncio.create_task(dispatcher.submit(message("a", 2)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert dispatcher.blocked == 1
+
+        release.set()
+        await blocked
+        while dispatcher.handled < 3:
+            await asyncio.sleep(0.01)
+        await dispatcher.stop()
+        return handled
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
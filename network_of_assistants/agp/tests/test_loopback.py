@@ -0,0 +1,149 @@
+import asyncio
+import zlib
+from types import SimpleNamespace
+
+import pytest
+
+from agp.loopback import SESSION_UNSPECIFIED, Gateway, Hub, is_loopback
+
+
+async def gateway(endpoint: str, agent: str) -> Gateway:
+    gw = await Gateway.new("cisco", "default", agent)
+    gw.configure(SimpleNamespace(endpoint=endpoint))
+    await gw.connect()
+    return gw
+
+
+async def drain(gw: Gateway, session: int = SESSION_UNSPECIFIED) -> list[bytes]:
+    # lets the scheduled deliveries run, then takes what was received
+    await asyncio.sleep(0.05)
+    queue = gw.sessions[session][1]
+    return [queue.get_nowait()[1] for _ in range(queue.qsize())]
+
+
+def test_is_loopback():
+    assert is_loopback("loopback://noa")
+    assert not is_loopback("http://localhost:12345")
+
+
+def test_hub_settings_from_endpoint():
+    Hub.reset()
+    hub = Hub.get("loopback://noa?latency_ms=2&jitter_ms=1&loss=0.5&seed=3")
+    assert (hub.latency, hub.jitter, hub.loss) == (0.002, 0.001, 0.5)
+    # the first gateway to connect decides the settings
+    assert Hub.get("loopback://noa") is hub
+    assert Hub.get("loopback://other") is not hub
+
+
+def test_fan_out_without_echo():
+    async def scenario():
+        Hub.reset()
+        a = await gateway("loopback://fan-out", "a")
+        b = await gateway("loopback://fan-out", "b")
+        c = await gateway("loopback://fan-out", "c")
+        for gw in (a, b, c):
+            await gw.subscribe("cisco", "default", "chat")
+
+        await a.publish(None, b"hello", "cisco", "default", "chat")
+        assert await drain(a) == []
+        assert await drain(b) == [b"hello"]
+        assert await drain(c) == [b"hello"]
+        assert a.hub.stats() == {"published": 1, "delivered": 2, "dropped": 0}
+
+        # a gateway is reachable by its own name
+        await b.publish(None, b"direct", "cisco", "default", "c")
+        assert await drain(c) == [b"direct"]
+        assert await drain(a) == []
+
+    asyncio.run(scenario())
+
+
+def test_order_is_kept_with_jitter():
+    async def scenario():
+        Hub.reset()
+        endpoint = "loopback://jitter?latency_ms=1&jitter_ms=20&seed=1"
+        a = await gateway(endpoint, "a")
+        b = await gateway(endpoint, "b")
+
+        messages = [str(i).encode() for i in range(20)]
+        for msg in messages:
+            await a.publish(None, msg, "cisco", "default", "b")
+        await asyncio.sleep(0.1)
+        assert await drain(b) == messages
+
+    asyncio.run(scenario())
+
+
+def test_loss_is_seeded():
+    async def scenario(seed: int) -> list[bytes]:
+        Hub.reset()
+        endpoint = f"loopback://loss?loss=0.5&seed={seed}"
+        a = await gateway(endpoint, "a")
+        b = await gateway(endpoint, "b")
+        for i in range(50):
+            await a.publish(None, str(i).encode(), "cisco", "default", "b")
+        received = await drain(b)
+        assert a.hub.dropped + len(received) == 50
+        return received
+
+    first = asyncio.run(scenario(7))
+    assert 0 < len(first) < 50
+    assert asyncio.run(scenario(7)) == first
+
+
+def test_publish_errors():
+    async def scenario():
+        Hub.reset()
+        a = await gateway("loopback://errors", "a")
+        with pytest.raises(Exception, match="no route"):
+            await a.publish(None, b"lost", "cisco", "default", "nobody")
+
+        # a route is enough to publish, even to nobody
+        await a.set_route("cisco", "default", "nobody")
+        await a.publish(None, b"lost", "cisco", "default", "nobody")
+
+        await a.disconnect()
+        with pytest.raises(ConnectionError):
+            await a.publish(None, b"lost", "cisco", "default", "a")
+
+    asyncio.run(scenario())
+
+
+def test_fail_ends_the_receive_loop():
+    async def scenario():
+        Hub.reset()
+        a = await gateway("loopback://fail", "a")
+        await a.__aenter__()
+        a.fail()
+        with pytest.raises(ConnectionError):
+            await a.task
+        assert not a.connected
+        with pytest.raises(ConnectionError):
+            await a.publish(None, b"lost", "cisco", "default", "a")
+
+    asyncio.run(scenario())
+
+
+def test_streaming_sessions_by_topic():
+    async def scenario():
+        Hub.reset()
+        a = await gateway("loopback://sessions", "a")
+        b = await gateway("loopback://sessions", "b")
+        topic = SimpleNamespace(organization="cisco", namespace="default", agent_type="chat")
+        config = SimpleNamespace(topic=topic)
+
+        session_a = await a.create_streaming_session(config)
+        session_b = await b.create_streaming_session(config)
+        # both ends of a shared space agree on the session id
+        assert session_a.id == session_b.id == zlib.crc32(b"cisco/default/chat")
+
+        await b.subscribe("cisco", "default", "chat")
+        await a.publish(session_a, b"in session", "cisco", "default", "chat")
+        await a.publish(None, b"direct", "cisco", "default", "b")
+        assert await drain(b, session_b.id) == [b"in session"]
+        assert await drain(b) == [b"direct"]
+
+        with pytest.raises(Exception, match="Session ID not found"):
+            await b.receive(session=1)
+
+    asyncio.run(scenario())
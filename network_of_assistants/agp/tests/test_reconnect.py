@@ -0,0 +1,74 @@
+import asyncio
+
+from agp import AGP
+from agp import loopback
+from agp.loopback import Hub, SessionInfo
+from agp.sessions import Session, SessionManager
+
+
+async def wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_reconnect_retries_when_replay_fails(monkeypatch):
+    publish = loopback.Gateway.publish
+    failures = {"left": 0}
+
+    async def flaky_publish(self, *args, **kwargs):
+        if failures["left"]:
+            failures["left"] -= 1
+            raise ConnectionError("lost again")
+        return await publish(self, *args, **kwargs)
+
+    monkeypatch.setattr(loopback.Gateway, "publish", flaky_publish)
+
+    async def scenario():
+        Hub.reset()
+        received = []
+
+        async def on_message(msg: bytes):
+            received.append(msg)
+
+        sender = AGP("loopback://reconnect", "sender", "chat")
+        receiver = AGP("loopback://reconnect", "receiver", "chat")
+        await sender.init()
+        await receiver.init()
+        await receiver.receive(callback=on_message)
+
+        sender.participant.fail()
+        await sender.publish(b"first")
+        # the first publish of the replay fails too
+        failures["left"] = 1
+        await sender.publish(b"second")
+
+        await wait_for(lambda: len(received) == 2)
+        assert received == [b"first", b"second"]
+        assert sender.sessions.connected
+        assert sender.reconnects == 2
+
+        await sender.close()
+        await receiver.close()
+
+    asyncio.run(scenario())
+
+
+class BrokenGateway:
+    async def publish(self, *args, **kwargs):
+        raise ConnectionError("lost")
+
+
+def test_failed_publish_on_full_buffer_counts_the_drop():
+    async def scenario():
+        sessions = SessionManager(BrokenGateway(), "company", "namespace", replay_buffer_size=2)
+        sessions.on_failure = lambda e: None
+        session = Session("chat", "chat", SessionInfo(1))
+        sessions.replay_buffer.extend([(session, b"1"), (session, b"2")])
+
+        assert not await sessions._deliver(session, b"0")
+        assert [msg for _, msg in sessions.replay_buffer] == [b"0", b"1"]
+        assert sessions.replay_dropped == 1
+
+    asyncio.run(scenario())
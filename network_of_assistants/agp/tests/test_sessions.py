@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from agp import AGP
+from agp.loopback import Hub
+
+
+async def wait_for(predicate, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_sessions_on_different_shared_spaces():
+    async def scenario():
+        Hub.reset()
+        received = {"chat": [], "other": []}
+
+        sender = AGP("loopback://sessions", "sender", "chat")
+        receiver = AGP("loopback://sessions", "receiver", "chat")
+        await sender.init()
+        await receiver.init()
+        sender_other = await sender.open_session("other")
+        receiver_other = await receiver.open_session("other")
+        assert sender_other.id != sender.session.id
+
+        async def on_chat(msg: bytes):
+            received["chat"].append(msg)
+
+        async def on_other(msg: bytes):
+            received["other"].append(msg)
+
+        await receiver.receive(callback=on_chat)
+        await receiver.receive(callback=on_other, session=receiver_other)
+
+        await sender.publish(b"chat:1")
+        await sender.publish(b"other:1", session=sender_other)
+        await wait_for(lambda: received["chat"] and received["other"])
+        assert received == {"chat": [b"chat:1"], "other": [b"other:1"]}
+
+        # closing one session leaves the other one receiving
+        await receiver.close_session(receiver_other)
+        assert "other" not in receiver.sessions
+        await sender.publish(b"other:2", session=sender_other)
+        await sender.publish(b"chat:2")
+        await wait_for(lambda: len(received["chat"]) == 2)
+        assert received == {"chat": [b"chat:1", b"chat:2"], "other": [b"other:1"]}
+
+        await sender.close()
+        await receiver.close()
+
+    asyncio.run(scenario())
+
+
+def test_one_session_per_shared_space():
+    async def scenario():
+        Hub.reset()
+        agp = AGP("loopback://sessions", "agent", "chat")
+        await agp.init()
+
+        with pytest.raises(ValueError):
+            await agp.open_session("chat")
+        with pytest.raises(ValueError):
+            await agp.open_session("second-chat", shared_space="chat")
+        assert len(agp.sessions) == 1
+
+        # the shared space can be opened again once its session is closed
+        session = await agp.open_session("other")
+        await agp.close_session(session)
+        session = await agp.open_session("other-again", shared_space="other")
+        assert agp.sessions.by_id(session.id) is session
+
+        await agp.close()
+
+    asyncio.run(scenario())
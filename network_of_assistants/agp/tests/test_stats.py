@@ -0,0 +1,8 @@
+from agp.stats import percentile
+
+
+def test_percentile():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([1, 2, 3, 4, 5], 0.5) == 3
+    assert percentile([1, 2, 3, 4, 5], 1.0) == 5
+    assert percentile([1.5], 0.95) == 1.5
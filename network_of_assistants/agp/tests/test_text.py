@@ -0,0 +1,12 @@
+from agp.text import count_tokens, normalize
+
+
+def test_normalize():
+    assert normalize("  How do I configure a VLAN?? ") == "how do i configure a vlan"
+    assert normalize("Hello, there!") == normalize("hello there")
+    assert normalize("") == ""
+
+
+def test_count_tokens():
+    assert count_tokens("") == 1
+    assert count_tokens("x" * 400) == 101
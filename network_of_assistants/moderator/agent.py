@@ -1,9 +1,17 @@
+import asyncio
+import contextlib
+
+from cache import ResponseCache
+from history import estimate_prompt_tokens, render_input
+from limits import LLMLimiter, SingleFlight, prompt_key
+from streaming import MessageStreamParser
+
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import BaseModel, Field
-from langchain_core.output_parsers import JsonOutputParser
-from typing import Optional, List, Literal, Union, Annotated
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from typing import AsyncIterator, Optional, List, Literal, Union, Annotated
 
 SYSTEM_PROMPT = """
 You are a moderator agent in a chat with a user and several
@@ -15,7 +23,8 @@ messages or requests to speak to the chat.
 You will be given:
 - a list of available agents
 - a list of agents in this chat
-- a chat history
+- a summary of the earlier chat history, if any
+- the recent chat history
 - an incoming message
 
 From this message, you can:
@@ -87,6 +96,9 @@ Your answer:
 
 """
 
+# The system prompt is static and the input goes from the most to the least
+# stable part, so consecutive prompts share the longest possible prefix and
+# benefit from prefix caching on the provider side
 INPUT_PROMPT = """
 All Available Agents:
 {agents_list}
@@ -94,6 +106,7 @@ All Available Agents:
 Agents Currently in this chat:
 {chat_agent_list}
 
+Summary of earlier history: {chat_summary}
 History: {chat_history}
 Query: {query_message}
 Your answer:
@@ -105,7 +118,13 @@ PROMPT_TEMPLATE = ChatPromptTemplate(
 
 
 class ModeratorAgent:
-    def __init__(self):
+    def __init__(
+        self,
+        llm=None,
+        limiter: Optional[LLMLimiter] = None,
+        cache: Optional[ResponseCache] = None,
+        streaming: bool = False,
+    ):
         class ModelConfig(BaseSettings):
             model_config = SettingsConfigDict(env_prefix="MODEL_")
             name: str = "gpt-4o"
@@ -136,17 +155,119 @@ class ModeratorAgent:
                 ]
             ]
 
-        model_config = ModelConfig()
+        if llm is None:
+            model_config = ModelConfig()
 
-        llm = ChatOpenAI(
-            model=model_config.name,
-            base_url=model_config.base_url,
-            api_key=model_config.api_key,
-        )
+            llm = ChatOpenAI(
+                model=model_config.name,
+                base_url=model_config.base_url,
+                api_key=model_config.api_key,
+            )
 
         parser = JsonOutputParser(pydantic_object=ModelAnswer)
 
         self.chain = PROMPT_TEMPLATE | llm | parser
-
-    def invoke(self, *args, **kwargs):
-        return self.chain.invoke(*args, **kwargs)
+        self.text_chain = PROMPT_TEMPLATE | llm | StrOutputParser()
+
+        # shared rate and concurrency limits of the LLM calls, identical
+        # calls in flight at the same time are merged into one
+        self.limiter = limiter
+        self.singleflight = SingleFlight()
+        self.cache = cache
+        self.streaming = streaming
+
+    def _slot(self, input: dict):
+        if self.limiter is None:
+            return contextlib.nullcontext()
+        return self.limiter.slot(estimate_prompt_tokens(SYSTEM_PROMPT + INPUT_PROMPT, input))
+
+    def invoke(self, input: dict, **kwargs):
+        return self.chain.invoke(render_input(input), **kwargs)
+
+    async def ainvoke(self, input: dict, **kwargs):
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(input)
+            answer = self.cache.get(key)
+            if answer is not None:
+                return answer
+
+        rendered = render_input(input)
+
+        async def call():
+            async with self._slot(rendered):
+                return await self.chain.ainvoke(rendered, **kwargs)
+
+        # calls the cache would answer alike are merged as well
+        answer = await self.singleflight.do(key or prompt_key(rendered), call)
+
+        if key is not None:
+            self.cache.put(key, answer)
+        return answer
+
+    async def amessages(self, input: dict, **kwargs) -> AsyncIterator[dict]:
+        # the messages of the answer, each one as soon as the LLM has
+        # generated it when streaming
+        if not self.streaming:
+            answer = await self.ainvoke(input, **kwargs)
+            for message in answer["messages"]:
+                yield message
+            return
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(input)
+            answer = self.cache.get(key)
+            if answer is not None:
+                for message in answer["messages"]:
+                    yield message
+                return
+
+        rendered = render_input(input)
+        # messages the call made here yields while the answer is generated
+        streamed = asyncio.Queue()
+        leader = False
+
+        async def call():
+            nonlocal leader
+            leader = True
+            parser = MessageStreamParser()
+            messages = []
+            async with self._slot(rendered):
+                async for chunk in self.text_chain.astream(rendered, **kwargs):
+                    for message in parser.feed(chunk):
+                        messages.append(message)
+                        # the floor is only handed over once the whole answer
+                        # parsed, so that an answer failing part-way never
+                        # leaves an agent speaking alongside the fallback to
+                        # the user
+                        if message["type"] != "RequestToSpeak":
+                            streamed.put_nowait(message)
+            parser.close()
+            return {"messages": messages}
+
+        # identical streamed calls are merged too: the caller making the call
+        # streams the answer, the others get it whole once it is complete
+        task = asyncio.create_task(self.singleflight.do(key or prompt_key(rendered), call))
+        get = None
+        try:
+            while True:
+                get = asyncio.ensure_future(streamed.get())
+                done, _ = await asyncio.wait({get, task}, return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    break
+                yield get.result()
+            while not streamed.empty():
+                yield streamed.get_nowait()
+            answer = task.result()
+        finally:
+            # also when the caller stops reading the answer
+            for future in (get, task):
+                if future is not None and not future.done():
+                    future.cancel()
+
+        if key is not None:
+            self.cache.put(key, answer)
+        for message in answer["messages"]:
+            if not leader or message["type"] == "RequestToSpeak":
+                yield message
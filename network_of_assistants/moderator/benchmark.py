@@ -0,0 +1,316 @@
+import argparse
+import ast
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+from typing import Any, AsyncIterator, List, Optional
+
+from agp import AGP
+from agp.stats import percentile
+from agp.loopback import Hub
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+import main as moderator
+
+# Runs the moderator, synthetic assistants and scripted user proxies in one
+# process over the loopback gateway, with a deterministic fake LLM, and
+# reports latency and throughput as JSON.
+
+class FakeLLM(BaseChatModel):
+    """Deterministic stand-in for the moderator and evaluator LLMs. Routes
+    every user question to one of the available agents and hands the turn
+    back to the user once the agent answered."""
+
+    latency: float = 0.0
+    stream_chunks: int = 8
+    calls: collections.Counter = Field(default_factory=collections.Counter)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-noa"
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content
+
+        if "Your final ratings" in prompt:
+            self.calls["evaluator"] += 1
+            count = len(re.findall(r"^### Answer \d+$", prompt, flags=re.MULTILINE))
+            return "\n".join(f"{number}: 1" for number in range(1, count + 1))
+        if "Your final rating" in prompt:
+            self.calls["evaluator"] += 1
+            return "1"
+
+        self.calls["moderator"] += 1
+        query = ast.literal_eval(
+            prompt.split("Query: ", 1)[1].split("\nYour answer:", 1)[0].strip()
+        )
+        agents_list = prompt.split("All Available Agents:", 1)[1]
+        agents = re.findall(r"^- ([^:\n]+):", agents_list, flags=re.MULTILINE)
+
+        if query["author"] == "user-proxy":
+            target = agents[zlib.crc32(query["message"].encode()) % len(agents)]
+            answer = [
+                {
+                    "type": "InviteToChat",
+                    "author": "moderator",
+                    "target": target,
+                    "summary": f"The user asks: {query['message']}",
+                },
+                {"type": "RequestToSpeak", "author": "moderator", "target": target},
+            ]
+        else:
+            answer = [
+                {"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"}
+            ]
+        return json.dumps({"messages": answer})
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency)
+        content = self._respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        content = self._respond(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        # the latency is spread evenly over the generated text
+        content = self._respond(messages)
+        size = -(-len(content) // self.stream_chunks)
+        for start in range(0, len(content), size):
+            await asyncio.sleep(self.latency / self.stream_chunks)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=content[start : start + size]))
+
+
+def write_agents(agents_dir: str, count: int) -> list[str]:
+    names = []
+    for i in range(count):
+        with open(os.path.join(agents_dir, f"assistant_{i}.json"), "w") as file:
+            json.dump(
+                {
+                    "name": f"Assistant {i}",
+                    "description": f"A synthetic assistant specialized in topic {i}.",
+                },
+                file,
+            )
+        names.append(f"assistant-{i}")
+    return names
+
+
+async def run_assistant(endpoint: str, assistant_id: str, latency: float, codec: str):
+    agp = AGP(agp_endpoint=endpoint, local_id=assistant_id, shared_space="chat", codec=codec)
+    await agp.init()
+
+    # work started when invited, the answer is sent once asked to speak
+    prepared: dict[str, asyncio.Task] = {}
+
+    async def on_message_received(message: bytes):
+        data = agp.decode(message)
+        if data["type"] == "InviteToChat" and data["target"] == assistant_id:
+            prepared[data["conversation_id"]] = asyncio.create_task(asyncio.sleep(latency))
+        elif data["type"] == "RequestToSpeak" and data["target"] == assistant_id:
+            work = prepared.pop(data["conversation_id"], None)
+            await (work or asyncio.sleep(latency))
+            await agp.send(
+                {
+                    "type": "ChatMessage",
+                    "author": assistant_id,
+                    "message": f"Synthetic answer from {assistant_id}.",
+                    "conversation_id": data["conversation_id"],
+                }
+            )
+
+    await agp.receive(callback=on_message_received)
+    return agp
+
+
+async def run_user(
+    endpoint: str,
+    conversation_id: str,
+    turns: int,
+    timeout: float,
+    codec: str,
+    shared_questions: bool,
+    results: dict,
+):
+    # every user proxy has the same id, like separate runs of user_proxy, and
+    # only follows the messages of its own conversation
+    agp = AGP(agp_endpoint=endpoint, local_id="user-proxy", shared_space="chat", codec=codec)
+    await agp.init()
+
+    answered = asyncio.Event()
+    turn_done = asyncio.Event()
+
+    async def on_message_received(message: bytes):
+        data = agp.decode(message)
+        if data.get("conversation_id") != conversation_id:
+            return
+        if data["type"] == "ChatMessage" and data["author"].startswith("assistant-"):
+            answered.set()
+        elif data["type"] == "RequestToSpeak" and data["target"] == "user-proxy":
+            turn_done.set()
+
+    await agp.receive(callback=on_message_received)
+
+    for turn in range(turns):
+        answered.clear()
+        turn_done.clear()
+        start = time.monotonic()
+        question = f"Question {turn}"
+        if not shared_questions:
+            question += f" from {conversation_id}"
+        await agp.send(
+            {
+                "type": "ChatMessage",
+                "author": "user-proxy",
+                "message": question,
+                "conversation_id": conversation_id,
+            }
+        )
+        try:
+            await asyncio.wait_for(answered.wait(), timeout)
+            results["answer"].append(time.monotonic() - start)
+            await asyncio.wait_for(turn_done.wait(), timeout)
+            results["turn"].append(time.monotonic() - start)
+        except asyncio.TimeoutError:
+            results["timeouts"] += 1
+
+    await agp.close()
+
+
+def latency_summary(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+async def benchmark(args) -> dict:
+    Hub.reset()
+    endpoint = (
+        f"loopback://benchmark?latency_ms={args.network_latency_ms}"
+        f"&jitter_ms={args.network_jitter_ms}&seed=0"
+    )
+    os.environ["AGP_ENDPOINT"] = endpoint
+    os.environ["AGP_CODEC"] = args.codec
+    os.environ["MODERATOR_STREAMING"] = str(args.streaming)
+
+    llm = FakeLLM(latency=args.llm_latency_ms / 1000)
+    results = {"answer": [], "turn": [], "timeouts": 0}
+
+    with tempfile.TemporaryDirectory() as agents_dir:
+        assistant_ids = write_agents(agents_dir, args.assistants)
+        moderator_args = argparse.Namespace(agents_dir=agents_dir)
+        os.environ["EVALUATOR_SCORES_LOG"] = os.path.join(agents_dir, "scores.jsonl")
+
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            moderator_task = asyncio.create_task(moderator.main(moderator_args, llm=llm))
+            assistants = [
+                await run_assistant(
+                    endpoint, assistant_id, args.assistant_latency_ms / 1000, args.codec
+                )
+                for assistant_id in assistant_ids
+            ]
+            # let every participant subscribe before the first question
+            await asyncio.sleep(0.1)
+
+            start = time.monotonic()
+            await asyncio.gather(
+                *(
+                    run_user(
+                        endpoint,
+                        f"conversation-{i}",
+                        args.turns,
+                        args.timeout,
+                        args.codec,
+                        args.shared_questions,
+                        results,
+                    )
+                    for i in range(args.users)
+                )
+            )
+            elapsed = time.monotonic() - start
+
+            moderator_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await moderator_task
+            for assistant in assistants:
+                await assistant.close()
+
+    hub = Hub.get(endpoint)
+    turns = len(results["turn"])
+    return {
+        "config": vars(args),
+        "elapsed_s": elapsed,
+        "turns": turns,
+        "timeouts": results["timeouts"],
+        "answer_latency": latency_summary(results["answer"]),
+        "turn_latency": latency_summary(results["turn"]),
+        "messages_per_second": hub.published / elapsed,
+        "turns_per_second": turns / elapsed,
+        "llm_calls": dict(llm.calls),
+        "llm_calls_per_turn": sum(llm.calls.values()) / turns if turns else 0.0,
+        "gateway": hub.stats(),
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Benchmark the network of assistants.")
+    parser.add_argument("--assistants", type=int, default=4, help="Number of synthetic assistants")
+    parser.add_argument("--users", type=int, default=4, help="Number of scripted user proxies")
+    parser.add_argument("--turns", type=int, default=5, help="Questions asked by each user")
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Latency of every fake LLM call")
+    parser.add_argument("--assistant-latency-ms", type=float, default=50, help="Time assistants take to answer")
+    parser.add_argument("--network-latency-ms", type=float, default=1.0, help="Loopback gateway latency")
+    parser.add_argument("--network-jitter-ms", type=float, default=0.0, help="Loopback gateway jitter")
+    parser.add_argument("--codec", type=str, default="json", choices=["json", "binary"])
+    parser.add_argument("--streaming", action="store_true", help="Stream the moderator answers")
+    parser.add_argument("--shared-questions", action="store_true", help="Let all users ask the same questions")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for an answer")
+    parser.add_argument("--output", type=str, default=None, help="Write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the participants' output")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(benchmark(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    print(report)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,59 @@
+import collections
+import copy
+import hashlib
+import json
+from typing import Optional
+
+
+class ResponseCache:
+    """LRU cache of moderator answers. The key is a hash of the agent lists,
+    the last history_messages messages of the history and the query, so the
+    same routing question is only sent to the LLM once."""
+
+    def __init__(self, max_entries: int = 1024, history_messages: int = 4):
+        self.max_entries = max_entries
+        self.history_messages = history_messages
+        self._entries: collections.OrderedDict[str, dict] = collections.OrderedDict()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, input: dict) -> str:
+        history = input["chat_history"]
+        history = history[-self.history_messages :] if self.history_messages else []
+        data = json.dumps(
+            [input["agents_list"], input["chat_agent_list"], history, input["query_message"]],
+            sort_keys=True,
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        answer = self._entries.get(key)
+        if answer is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(answer)
+
+    def put(self, key: str, answer: dict):
+        self._entries[key] = copy.deepcopy(answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
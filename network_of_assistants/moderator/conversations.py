@@ -0,0 +1,9 @@
+from history import ChatHistory
+
+
+class Conversation:
+    def __init__(self, conversation_id: str, history: ChatHistory):
+        self.id = conversation_id
+        self.history = history
+        self.agents: set[str] = set()
+        self.llm_calls_avoided = 0
@@ -0,0 +1,113 @@
+import json
+import os
+import time
+
+
+def agent_id(name: str) -> str:
+    return name.lower().strip().replace(" ", "-")
+
+
+class AgentDirectory:
+    """In-memory view of the OASF datamodels in agents_dir. Files are parsed
+    once and only re-read when their mtime or size changes. The directory is
+    checked at most once every check_interval seconds, so lookups on the hot
+    path are dictionary reads."""
+
+    def __init__(self, agents_dir: str, check_interval: float = 1.0):
+        self.agents_dir = agents_dir
+        self.check_interval = check_interval
+
+        # file name -> (mtime_ns, size, agent id, description, skills)
+        self._files: dict[str, tuple[int, int, str, str, str]] = {}
+        # file name -> (mtime_ns, size) of the files that did not parse, so
+        # that they are not re-read until they change
+        self._failed: dict[str, tuple[int, int]] = {}
+        self._agents: dict[str, str] = {}
+        self._skills: dict[str, str] = {}
+        self._string = ""
+        self._checked_at = None
+
+        self.reloads = 0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        files = {}
+        failed = {}
+        changed = False
+        try:
+            entries = list(os.scandir(self.agents_dir))
+        except OSError as e:
+            print(f"Error reading {self.agents_dir}: {e}")
+            entries = []
+
+        for entry in entries:
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            cached = self._files.get(entry.name)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                files[entry.name] = cached
+                continue
+            if self._failed.get(entry.name) == (stat.st_mtime_ns, stat.st_size):
+                failed[entry.name] = self._failed[entry.name]
+                continue
+
+            changed = True
+            try:
+                with open(entry.path, "r") as file:
+                    data = json.load(file)
+                skills = ", ".join(
+                    f"{skill['class_name']} ({skill['category_name']})"
+                    for skill in data.get("skills", [])
+                )
+                files[entry.name] = (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                    agent_id(data["name"]),
+                    data["description"],
+                    skills,
+                )
+            except (json.JSONDecodeError, FileNotFoundError, OSError, KeyError, TypeError) as e:
+                print(f"Error reading {entry.path}: {e}")
+                failed[entry.name] = (stat.st_mtime_ns, stat.st_size)
+
+        self._failed = failed
+
+        if changed or files.keys() != self._files.keys():
+            self._files = files
+            entries = [files[f] for f in sorted(files)]
+            self._agents = {name: description for _, _, name, description, _ in entries}
+            self._skills = {name: skills for _, _, name, _, skills in entries}
+            self._string = agents_to_string(self._agents)
+            self.reloads += 1
+
+    def agents(self) -> dict[str, str]:
+        self._refresh()
+        return self._agents
+
+    def agents_string(self) -> str:
+        self._refresh()
+        return self._string
+
+    def skills(self) -> dict[str, str]:
+        self._refresh()
+        return self._skills
+
+    def subset(self, names) -> dict[str, str]:
+        agents = self.agents()
+        return {name: desc for name, desc in agents.items() if name in names}
+
+
+def agents_to_string(agents):
+    output_strings = []
+    for name, description in agents.items():
+        output_strings.append(f"- {name}: {description}")
+    return "\n".join(output_strings)
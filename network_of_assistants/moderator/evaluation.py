@@ -0,0 +1,131 @@
+import asyncio
+import datetime
+import json
+import random
+from typing import Optional
+
+
+def parse_score(content: str) -> Optional[int]:
+    # the evaluator answers "NA" when the moderator did not grant speaking
+    # rights, otherwise 0 or 1 for whether it picked the best-fitting agent
+    if "NA" in content:
+        return None
+    return 0 if "0" in content else 1
+
+
+class EvaluationPipeline:
+    """Evaluates a sample of the moderator answers in the background, in
+    batches, and appends the scores to a JSON lines log. Answers are
+    submitted after they have been published, so evaluation never adds to
+    the latency seen by the user."""
+
+    def __init__(
+        self,
+        evaluator_agent,
+        sample_rate: float = 1.0,
+        workers: int = 2,
+        batch_size: int = 4,
+        max_queue: int = 1000,
+        scores_path: str = "evaluator_scores.jsonl",
+        seed: Optional[int] = None,
+    ):
+        self.evaluator_agent = evaluator_agent
+        self.sample_rate = sample_rate
+        self.workers = workers
+        self.batch_size = batch_size
+        self.scores_path = scores_path
+        self.random = random.Random(seed)
+
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._tasks: list[asyncio.Task] = []
+        self._write_lock = asyncio.Lock()
+
+        # counters
+        self.submitted = 0
+        self.skipped = 0
+        self.dropped = 0
+        self.evaluated = 0
+        self.errors = 0
+        self.scores = {"0": 0, "1": 0, "NA": 0}
+
+    def start(self):
+        if self._tasks or self.sample_rate <= 0:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain: bool = True):
+        if drain and self._tasks:
+            await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, evaluation_input: dict) -> bool:
+        self.submitted += 1
+        if self.sample_rate < 1.0 and self.random.random() >= self.sample_rate:
+            self.skipped += 1
+            return False
+        try:
+            self.queue.put_nowait(evaluation_input)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                results = await self.evaluator_agent.abatch(batch)
+                await self._record(batch, results)
+            except Exception as e:
+                self.errors += len(batch)
+                print(f"Error evaluating moderator answers: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _record(self, batch: list[dict], results: list):
+        lines = []
+        for evaluation_input, result in zip(batch, results):
+            if isinstance(result, Exception):
+                self.errors += 1
+                print(f"Error evaluating moderator answer: {result}")
+                continue
+
+            score = parse_score(result.content)
+            self.evaluated += 1
+            self.scores["NA" if score is None else str(score)] += 1
+            record = {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "query_message": evaluation_input["query_message"],
+                "moderator_answer": evaluation_input["moderator_answer"],
+                "score": score,
+                "rating": result.content,
+            }
+            lines.append(json.dumps(record) + "\n")
+
+        # the log is appended to off the event loop, one batch at a time so
+        # that the lines of concurrent workers do not interleave
+        if lines:
+            async with self._write_lock:
+                await asyncio.to_thread(self._append, "".join(lines))
+
+    def _append(self, text: str):
+        with open(self.scores_path, "a") as file:
+            file.write(text)
+
+    def stats(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+            "evaluated": self.evaluated,
+            "errors": self.errors,
+            "pending": self.queue.qsize(),
+            "scores": dict(self.scores),
+        }
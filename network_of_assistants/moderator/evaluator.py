@@ -1,7 +1,15 @@
+import asyncio
+import contextlib
+import re
+
+from history import estimate_prompt_tokens, render_input
+from limits import LLMLimiter, SingleFlight, prompt_key
+
 from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import BaseModel
+from langchain_core.messages import AIMessage
 from langchain_core.output_parsers import JsonOutputParser
 from typing import Optional, List
 
@@ -13,8 +21,8 @@ the query is answered. Your job is to evaluate at each pass if the moderator
 is choosing the correct agent or not, to reach the answer for the query.
 If the moderator is not granting speaking rights, you just answer "NA". 
 
-The moderator is given a list of agents, a chat history, and an incoming
-message. From this message, the moderator messages can:
+The moderator is given a list of agents, a summary of the earlier chat history,
+the recent chat history, and an incoming message. From this message, the moderator messages can:
 - invite an agent to the chat (if not already present) with a brief summary of the ask
 {{"type": "InviteToChat", "author": "moderator", "target": "<agent-id>", "summary": "<summary-of-ask>"}}
 - grant an agent the right to speak by sending a RequestToSpeak message to an agent <agent-id>
@@ -63,6 +71,7 @@ INPUT_PROMPT = """
 Agent list:
 {agents_list}
 
+Summary of earlier history: {chat_summary}
 History: {chat_history}
 Query: {query_message}
 Moderator answer: {moderator_answer}
@@ -72,9 +81,43 @@ Your final rating:
 
 PROMPT_TEMPLATE = ChatPromptTemplate([("system", SYSTEM_PROMPT), ("user", INPUT_PROMPT)])
 
+# several answers rated in one call, each laid out like INPUT_PROMPT
+BATCH_ANSWER_PROMPT = """
+### Answer {number}
+Agent list:
+{agents_list}
+
+Summary of earlier history: {chat_summary}
+History: {chat_history}
+Query: {query_message}
+Moderator answer: {moderator_answer}
+"""
+
+BATCH_INPUT_PROMPT = """
+Rate each of the {count} moderator answers below on its own.
+{answers}
+Your final ratings, one line per answer as "<answer number>: <rating>":
+"""
+
+BATCH_PROMPT_TEMPLATE = ChatPromptTemplate(
+    [("system", SYSTEM_PROMPT), ("user", BATCH_INPUT_PROMPT)]
+)
+
+_RATING_LINE = re.compile(r"^\W*(?:answer\s*)?(\d+)\s*[:.)-]\s*(\S.*)$", re.IGNORECASE)
+
+
+def parse_ratings(content: str, count: int) -> dict[int, str]:
+    # answer index -> rating, for the lines of a batch reply that parse
+    ratings = {}
+    for line in content.splitlines():
+        match = _RATING_LINE.match(line.strip())
+        if match is not None and 1 <= int(match.group(1)) <= count:
+            ratings.setdefault(int(match.group(1)) - 1, match.group(2).strip())
+    return ratings
+
 
 class EvaluatorAgent:
-    def __init__(self):
+    def __init__(self, llm=None, limiter: Optional[LLMLimiter] = None):
         class ModelConfig(BaseSettings):
             model_config = SettingsConfigDict(env_prefix="MODEL_")
             name: str = "gpt-4o"
@@ -89,15 +132,88 @@ class EvaluatorAgent:
         class ModelAnswer(BaseModel):
             messages: List[SingleMessage]
 
-        model_config = ModelConfig()
+        if llm is None:
+            model_config = ModelConfig()
 
-        llm = ChatOpenAI(
-            model=model_config.name,
-            base_url=model_config.base_url,
-            api_key=model_config.api_key,
-        )
+            llm = ChatOpenAI(
+                model=model_config.name,
+                base_url=model_config.base_url,
+                api_key=model_config.api_key,
+            )
 
         self.chain = PROMPT_TEMPLATE | llm
-
-    def invoke(self, *args, **kwargs):
-        return self.chain.invoke(*args, **kwargs)
+        self.batch_chain = BATCH_PROMPT_TEMPLATE | llm
+
+        # shared rate and concurrency limits of the LLM calls, identical
+        # calls in flight at the same time are merged into one
+        self.limiter = limiter
+        self.singleflight = SingleFlight()
+
+        # counters
+        self.batches = 0
+        self.batched_answers = 0
+        self.unbatched_answers = 0
+
+    def _slot(self, input: dict, template: str = INPUT_PROMPT):
+        if self.limiter is None:
+            return contextlib.nullcontext()
+        return self.limiter.slot(estimate_prompt_tokens(SYSTEM_PROMPT + template, input))
+
+    def invoke(self, input: dict, **kwargs):
+        return self.chain.invoke(render_input(input), **kwargs)
+
+    async def ainvoke(self, input: dict, **kwargs):
+        rendered = render_input(input)
+
+        async def call():
+            async with self._slot(rendered):
+                return await self.chain.ainvoke(rendered, **kwargs)
+
+        return await self.singleflight.do(prompt_key(rendered), call)
+
+    async def abatch(self, inputs: list[dict]) -> list:
+        """Rates all the inputs in one LLM call. Inputs whose rating is
+        missing from the reply are rated on their own. Returns a message or
+        an exception per input."""
+        ratings = {}
+        if len(inputs) > 1:
+            rendered = {
+                "count": len(inputs),
+                "answers": "".join(
+                    BATCH_ANSWER_PROMPT.format(number=number, **render_input(evaluation_input))
+                    for number, evaluation_input in enumerate(inputs, start=1)
+                ),
+            }
+
+            async def call():
+                async with self._slot(rendered, BATCH_INPUT_PROMPT):
+                    return await self.batch_chain.ainvoke(rendered)
+
+            try:
+                reply = await self.singleflight.do(prompt_key(rendered), call)
+                ratings = parse_ratings(reply.content, len(inputs))
+                self.batches += 1
+                self.batched_answers += len(ratings)
+            except Exception as e:
+                print(f"Error evaluating a batch of moderator answers: {e}")
+
+        missing = [index for index in range(len(inputs)) if index not in ratings]
+        self.unbatched_answers += len(missing)
+        singles = await asyncio.gather(
+            *(self.ainvoke(input=inputs[index]) for index in missing),
+            return_exceptions=True,
+        )
+        results = [
+            AIMessage(content=ratings[index]) if index in ratings else None
+            for index in range(len(inputs))
+        ]
+        for index, result in zip(missing, singles):
+            results[index] = result
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "batched_answers": self.batched_answers,
+            "unbatched_answers": self.unbatched_answers,
+        }
@@ -0,0 +1,112 @@
+import collections
+import json
+import textwrap
+
+from agp.text import count_tokens
+
+
+def estimate_prompt_tokens(template: str, input: dict) -> int:
+    return count_tokens(template) + sum(count_tokens(str(value)) for value in input.values())
+
+
+def summarize_message(message: dict, width: int = 160) -> str:
+    author = message.get("author", "unknown")
+    if message.get("type") == "ChatMessage":
+        text = message.get("message", "")
+        return f"{author}: {textwrap.shorten(text, width, placeholder='...')}"
+    if message.get("type") == "InviteToChat":
+        summary = textwrap.shorten(message.get("summary", ""), width, placeholder="...")
+        return f"{author} invited {message.get('target')}: {summary}"
+    if message.get("type") == "RequestToSpeak":
+        return f"{author} asked {message.get('target')} to speak"
+    return textwrap.shorten(json.dumps(message), width, placeholder="...")
+
+
+def render_input(input: dict) -> dict:
+    # messages are rendered as JSON like in the prompt examples, so the same
+    # history always gives byte-identical prompts
+    rendered = dict(input)
+    for name in ("chat_history", "query_message"):
+        if not isinstance(rendered.get(name), str):
+            rendered[name] = json.dumps(rendered[name])
+    return rendered
+
+
+class ChatHistory:
+    """Chat history for the moderator prompts, bounded by a token budget.
+    The last keep_last messages are kept verbatim. Older messages are folded
+    one line each into a running summary as they fall out of that window.
+    When the summary outgrows the rest of the budget, its oldest lines are
+    dropped."""
+
+    def __init__(self, token_budget: int = 4000, keep_last: int = 20):
+        self.token_budget = token_budget
+        self.keep_last = keep_last
+
+        # (message, tokens) kept verbatim, and (line, tokens) of the summary
+        self._recent: collections.deque = collections.deque()
+        self._recent_tokens = 0
+        self._summary: collections.deque = collections.deque()
+        self._summary_tokens = 0
+
+        # metrics
+        self.total_messages = 0
+        self.total_tokens = 0
+        self.folded_messages = 0
+        self.dropped_lines = 0
+
+    def __len__(self):
+        return self.total_messages
+
+    def append(self, message: dict):
+        tokens = count_tokens(json.dumps(message))
+        self._recent.append((message, tokens))
+        self._recent_tokens += tokens
+        self.total_messages += 1
+        self.total_tokens += tokens
+
+        # keep at least the newest message verbatim, whatever its size
+        while len(self._recent) > 1 and (
+            len(self._recent) > self.keep_last or self._recent_tokens > self.token_budget
+        ):
+            self._fold(*self._recent.popleft())
+
+        while self._summary and self._summary_tokens + self._recent_tokens > self.token_budget:
+            _, line_tokens = self._summary.popleft()
+            self._summary_tokens -= line_tokens
+            self.dropped_lines += 1
+
+    def _fold(self, message: dict, tokens: int):
+        self._recent_tokens -= tokens
+        line = summarize_message(message)
+        line_tokens = count_tokens(line) + 1
+        self._summary.append((line, line_tokens))
+        self._summary_tokens += line_tokens
+        self.folded_messages += 1
+
+    def messages(self) -> list[dict]:
+        return [message for message, _ in self._recent]
+
+    def summary(self) -> str:
+        if not self._summary:
+            return "None"
+        lines = [line for line, _ in self._summary]
+        if self.dropped_lines:
+            lines.insert(0, "(earlier messages omitted)")
+        return "\n".join(lines)
+
+    def prompt_tokens(self) -> int:
+        return self._recent_tokens + self._summary_tokens
+
+    def stats(self) -> dict:
+        prompt_tokens = self.prompt_tokens()
+        return {
+            "messages": self.total_messages,
+            "verbatim_messages": len(self._recent),
+            "folded_messages": self.folded_messages,
+            "summary_lines": len(self._summary),
+            "prompt_tokens": prompt_tokens,
+            "summary_tokens": self._summary_tokens,
+            "full_history_tokens": self.total_tokens,
+            "tokens_saved": self.total_tokens - prompt_tokens,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import contextlib
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Hashable, Optional
+
+from agp.stats import percentile
+
+
+class TokenBucket:
+    """Allows rate_per_minute units per minute, in bursts of at most
+    capacity units (a full minute's worth by default). Waiters are served in
+    order."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        # a request larger than the bucket would never fit, let it drain it
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.available < amount:
+                await asyncio.sleep((amount - self.available) / self.rate)
+                self._refill()
+            self.available -= amount
+
+
+class LLMLimiter:
+    """Gate in front of the LLM clients: at most max_concurrency calls in
+    flight, and at most requests_per_minute calls and tokens_per_minute
+    tokens per minute, so that the provider does not answer with 429s. The
+    time calls spend waiting at the gate is tracked."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        completion_tokens: int = 256,
+        latency_window: int = 1024,
+    ):
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # providers count the completion against the limit too
+        self.completion_tokens = completion_tokens
+
+        self.waits: collections.deque = collections.deque(maxlen=latency_window)
+        self.calls = 0
+        self.waiting = 0
+
+    def share(self, max_concurrency: int) -> "LLMLimiter":
+        # a limiter with a concurrency cap of its own, drawing on the same
+        # provider rate limits
+        limiter = LLMLimiter(
+            max_concurrency=max_concurrency,
+            completion_tokens=self.completion_tokens,
+            latency_window=self.waits.maxlen,
+        )
+        limiter.requests = self.requests
+        limiter.tokens = self.tokens
+        return limiter
+
+    @contextlib.asynccontextmanager
+    async def slot(self, prompt_tokens: int = 0):
+        start = time.monotonic()
+        acquired = False
+        self.waiting += 1
+        try:
+            async with self.semaphore:
+                if self.requests is not None:
+                    await self.requests.acquire(1)
+                if self.tokens is not None:
+                    await self.tokens.acquire(prompt_tokens + self.completion_tokens)
+                acquired = True
+                self.waiting -= 1
+                self.waits.append(time.monotonic() - start)
+                self.calls += 1
+                yield
+        finally:
+            if not acquired:
+                self.waiting -= 1
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        return {
+            "calls": self.calls,
+            "waiting": self.waiting,
+            "wait_p50_ms": percentile(waits, 0.50) * 1000,
+            "wait_p95_ms": percentile(waits, 0.95) * 1000,
+            "wait_max_ms": (waits[-1] if waits else 0.0) * 1000,
+        }
+
+
+class CallCancelled(Exception):
+    """The call a SingleFlight caller was waiting for was cancelled."""
+
+
+class SingleFlight:
+    """Runs one call per key at a time: callers asking for a key already in
+    flight wait for that call's result instead of making their own. When
+    that call is cancelled, the callers waiting for it make the call again
+    rather than being cancelled with it."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.merged = 0
+        self.retried = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        future = self._calls.get(key)
+        while future is not None:
+            self.merged += 1
+            try:
+                return await asyncio.shield(future)
+            except CallCancelled:
+                self.retried += 1
+                future = self._calls.get(key)
+
+        self.calls += 1
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # only the caller that made the call is cancelled
+            future.set_exception(CallCancelled(f"Call for {key!r} was cancelled"))
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # mark it retrieved, there may be no other caller waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "merged": self.merged, "retried": self.retried}
+
+
+def prompt_key(input: dict) -> str:
+    return hashlib.sha256(json.dumps(input, sort_keys=True).encode("utf-8")).hexdigest()
@@ -1,103 +1,176 @@
 import os
 import json
 import argparse
+import asyncio
 from agp import AGP
+from agp.conversations import ConversationStore
 from agent import ModeratorAgent
 from langchain_core.exceptions import OutputParserException
 from evaluator import EvaluatorAgent
+from directory import AgentDirectory, agents_to_string
+from evaluation import EvaluationPipeline
+from history import ChatHistory
+from conversations import Conversation
+from cache import ResponseCache
+from router import GREETING_REPLY, FastPathRouter
+from preselect import AgentPreselector, HashingEmbedder
+from limits import LLMLimiter
 
 
-def list_available_agents(agents_dir):
-    available_agents = {}
-
-    for filename in os.listdir(agents_dir):
-        if filename.endswith(".json"):
-            file_path = os.path.join(agents_dir, filename)
-            try:
-                with open(file_path, "r") as file:
-                    data = json.load(file)
-                    available_agents[data["name"].lower().strip().replace(" ", "-")] = (
-                        data["description"]
-                    )
-            except (json.JSONDecodeError, FileNotFoundError, OSError) as e:
-                print(f"Error reading {file_path}: {e}")
-
-    return available_agents
-
-
-def agents_to_string(agents):
-    output_strings = []
-    for name, description in agents.items():
-        output_strings.append(f"- {name}: {description}")
-    return "\n".join(output_strings)
-
-
-async def main(args):
+async def main(args, llm=None):
     # Instantiate the AGP class
     agp = AGP(
         agp_endpoint=os.getenv("AGP_ENDPOINT", "http://localhost:12345"),
         local_id="moderator",
         shared_space="chat",
+        batch_window=float(os.getenv("AGP_BATCH_WINDOW_MS", "0")) / 1000,
+        codec=os.getenv("AGP_CODEC", "json"),
     )
     await agp.init()
 
-    agents_dir = args.agents_dir
+    # parsed once, re-read only when the datamodels change
+    agent_directory = AgentDirectory(args.agents_dir)
+
+    # only the MODERATOR_TOP_K_AGENTS agents closest to a message are listed
+    # in its prompt
+    preselector = AgentPreselector(
+        agent_directory,
+        top_k=int(os.getenv("MODERATOR_TOP_K_AGENTS", "8")),
+        embedder=HashingEmbedder(dim=int(os.getenv("MODERATOR_EMBEDDING_DIM", "1024"))),
+    )
+
+    # LLM calls run on the event loop without blocking it, at most
+    # MODEL_MAX_CONCURRENCY moderator calls at a time, and within the
+    # provider's rate limits
+    llm_limiter = LLMLimiter(
+        max_concurrency=int(os.getenv("MODEL_MAX_CONCURRENCY", "8")),
+        requests_per_minute=float(os.getenv("MODEL_REQUESTS_PER_MINUTE", "0")) or None,
+        tokens_per_minute=float(os.getenv("MODEL_TOKENS_PER_MINUTE", "0")) or None,
+    )
+
+    # answers to routing questions already asked, in any conversation
+    cache_size = int(os.getenv("MODERATOR_CACHE_SIZE", "1024"))
+    response_cache = None
+    if cache_size > 0:
+        response_cache = ResponseCache(
+            max_entries=cache_size,
+            history_messages=int(os.getenv("MODERATOR_CACHE_HISTORY", "4")),
+        )
+    moderator_agent = ModeratorAgent(
+        llm=llm,
+        limiter=llm_limiter,
+        cache=response_cache,
+        streaming=os.getenv("MODERATOR_STREAMING", "false").lower() in ("1", "true", "yes"),
+    )
+    # the evaluator has slots of its own, so that background evaluation never
+    # holds back moderator calls, but shares the provider rate limits
+    evaluator_limiter = llm_limiter.share(
+        max_concurrency=int(os.getenv("EVALUATOR_MAX_CONCURRENCY", "2"))
+    )
+    evaluator_agent = EvaluatorAgent(llm=llm, limiter=evaluator_limiter)
 
-    moderator_agent = ModeratorAgent()
-    evaluator_agent = EvaluatorAgent()
+    # the evaluator scores a sample of the answers in the background, after
+    # they have been published
+    evaluation = EvaluationPipeline(
+        evaluator_agent,
+        sample_rate=float(os.getenv("EVALUATOR_SAMPLE_RATE", "1.0")),
+        workers=int(os.getenv("EVALUATOR_WORKERS", "2")),
+        batch_size=int(os.getenv("EVALUATOR_BATCH_SIZE", "4")),
+        scores_path=os.getenv("EVALUATOR_SCORES_LOG", "evaluator_scores.jsonl"),
+    )
+    evaluation.start()
 
-    chat_history = []
+    # chat history and invited agents of every conversation, dropped once the
+    # conversation has been idle for MODERATOR_CONVERSATION_TTL seconds. In
+    # the history, recent messages are kept verbatim and older ones folded
+    # into a running summary
+    conversations = ConversationStore(
+        lambda conversation_id: Conversation(
+            conversation_id,
+            ChatHistory(
+                token_budget=int(os.getenv("MODERATOR_HISTORY_TOKENS", "4000")),
+                keep_last=int(os.getenv("MODERATOR_HISTORY_MESSAGES", "20")),
+            ),
+        ),
+        shards=int(os.getenv("MODERATOR_CONVERSATION_SHARDS", "16")),
+        idle_ttl=float(os.getenv("MODERATOR_CONVERSATION_TTL", "1800")),
+        max_conversations=int(os.getenv("MODERATOR_MAX_CONVERSATIONS", "0")) or None,
+    )
 
-    chat_agents = set()
+    # mechanical decisions are taken without asking the LLM, with the rules
+    # listed in MODERATOR_FAST_PATH
+    rules = os.getenv("MODERATOR_FAST_PATH", "agent-answered,greeting")
+    router = FastPathRouter(
+        rules=[rule.strip() for rule in rules.split(",") if rule.strip()],
+        greeting_reply=os.getenv("MODERATOR_GREETING_REPLY", GREETING_REPLY),
+    )
 
     async def on_message_received(message: bytes):
-        # Decode the message from bytes to string
-        decoded_message = message.decode("utf-8")
-        json_message = json.loads(decoded_message)
+        # Decode the message from bytes, whatever codec the sender used
+        json_message = agp.decode(message)
 
         print(f"Received message: {json_message}")
+        conversation_id = json_message.pop("conversation_id", None)
+        conversation = conversations.get(conversation_id)
+        chat_history = conversation.history
         chat_history.append(json_message)
 
+        async def send(answer):
+            chat_history.append(answer)
+            if conversation_id is not None:
+                answer = {**answer, "conversation_id": conversation_id}
+            await agp.send(answer)
+
         if json_message["type"] == "ChatMessage":
+            fast_answers = router.route(json_message, conversation)
+            if fast_answers is not None:
+                print(
+                    f"Answered without the LLM, {conversation.llm_calls_avoided} "
+                    f"LLM calls avoided in conversation {conversation.id}"
+                )
+                for answer in fast_answers["messages"]:
+                    print(f"Sending answer: {answer}")
+                    await send(answer)
+                return
+
             try:
-                available_agents = list_available_agents(agents_dir)
-                chat_agents_with_desc = {
-                    name: desc
-                    for name, desc in available_agents.items()
-                    if name in chat_agents
-                }
+                chat_agents_with_desc = agent_directory.subset(conversation.agents)
+                agents_list = agents_to_string(preselector.select(json_message["message"]))
 
-                answers_list = moderator_agent.invoke(
+                print(f"Prompt history: {chat_history.stats()}")
+                # with MODERATOR_STREAMING, every message is published as soon
+                # as it has been generated
+                answers = moderator_agent.amessages(
                     input={
-                        "agents_list": agents_to_string(available_agents),
+                        "agents_list": agents_list,
                         "chat_agent_list": agents_to_string(chat_agents_with_desc),
-                        "chat_history": chat_history,
+                        "chat_summary": chat_history.summary(),
+                        "chat_history": chat_history.messages(),
                         "query_message": json_message,
                     }
                 )
-                for answer in answers_list["messages"]:
+                # evaluated once the whole answer is out, so that the
+                # evaluator does not compete with the answer for LLM slots
+                evaluation_inputs = []
+                async for answer in answers:
                     if answer["type"] == "InviteToChat":
-                        chat_agents.add(answer["target"])
+                        conversation.agents.add(answer["target"])
 
                     print(f"Sending answer: {answer}")
-                    chat_history.append(answer)
-                    answer_str = json.dumps(answer)
+                    await send(answer)
 
-                    evaluator_score = evaluator_agent.invoke(
-                        input={
-                            "agents_list": list_available_agents(agents_dir),
-                            "chat_history": chat_history,
+                    evaluation_inputs.append(
+                        {
+                            "agents_list": agents_list,
+                            "chat_summary": chat_history.summary(),
+                            "chat_history": chat_history.messages(),
                             "query_message": json_message,
-                            "moderator_answer": answer_str
+                            "moderator_answer": json.dumps(answer),
                         }
                     )
-                    if not "NA" in evaluator_score:
-                        if "0" in evaluator_score:
-                            print(f"The evaluator judges that the moderator did not choose the best-fitting agent.")
-                        else:
-                            print(f"The evaluator judges that moderator chose the best-fitting agent.")
 
-                    await agp.publish(msg=answer_str.encode("utf-8"))
+                for evaluation_input in evaluation_inputs:
+                    evaluation.submit(evaluation_input)
 
             except OutputParserException as e:
                 print(f"Wrong format from moderator: {e}")
@@ -107,26 +180,74 @@ async def main(args):
                     "author": "moderator",
                     "message": f"Moderator failed: {e}",
                 }
-                chat_history.append(answer)
-                answer_str = json.dumps(answer)
-                await agp.publish(msg=answer_str.encode("utf-8"))
+                await send(answer)
                 answer = {
                     "type": "RequestToSpeak",
                     "author": "moderator",
                     "target": "user-proxy",
                 }
-                chat_history.append(answer)
-                answer_str = json.dumps(answer)
-                await agp.publish(msg=answer_str.encode("utf-8"))
+                await send(answer)
 
-    # Connect to the AGP server and start receiving messages
-    await agp.receive(callback=on_message_received)
-    await agp.receive_task
+    def busy_reply(message: bytes):
+        json_message = agp.decode(message)
+        if json_message["type"] != "ChatMessage":
+            return []
 
+        # hand the turn to the user so that they can retry later. Handing it
+        # to an assistant would start another LLM run while overloaded
+        replies = [
+            {
+                "type": "ChatMessage",
+                "author": "moderator",
+                "message": "The moderator is busy, please try again later.",
+            },
+            {
+                "type": "RequestToSpeak",
+                "author": "moderator",
+                "target": "user-proxy",
+            },
+        ]
+        if "conversation_id" in json_message:
+            for reply in replies:
+                reply["conversation_id"] = json_message["conversation_id"]
+        return [agp.encode(reply) for reply in replies]
 
-def run():
-    import asyncio
+    def conversation_key(message: bytes):
+        try:
+            return agp.decode(message).get("conversation_id") or agp.shared_space
+        except (ValueError, IndexError):
+            return agp.shared_space
 
+    # Connect to the AGP server and start receiving messages.
+    # Messages of one conversation are handled in order, different
+    # conversations in parallel, off the receive loop
+    await agp.receive(
+        callback=on_message_received,
+        workers=int(os.getenv("MODERATOR_WORKERS", "4")),
+        key=conversation_key,
+        stats_interval=float(os.getenv("AGP_STATS_INTERVAL", "0")) or None,
+        max_queue=int(os.getenv("MODERATOR_MAX_QUEUE", "0")) or None,
+        policy=os.getenv("MODERATOR_OVERLOAD_POLICY", "block"),
+        busy_reply=busy_reply,
+    )
+    try:
+        await agp.receive_task
+    finally:
+        await evaluation.stop(drain=False)
+        print(f"Conversation stats: {conversations.stats()}")
+        print(f"Fast path stats: {router.stats()}")
+        if response_cache is not None:
+            print(f"Response cache stats: {response_cache.stats()}")
+        print(f"Evaluator stats: {evaluation.stats()}, {evaluator_agent.stats()}")
+        print(f"LLM limiter stats: {llm_limiter.stats()}")
+        print(f"Evaluator LLM limiter stats: {evaluator_limiter.stats()}")
+        print(
+            f"Merged LLM calls: moderator {moderator_agent.singleflight.stats()}, "
+            f"evaluator {evaluator_agent.singleflight.stats()}"
+        )
+
+
+def run():
     parser = argparse.ArgumentParser(description="Start AGP command interface.")
     parser.add_argument(
         "--endpoint",
@@ -0,0 +1,96 @@
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+class HashingEmbedder:
+    """Embeds texts without a model: word unigrams and bigrams are hashed
+    into dim buckets with a random sign, which works offline and gives the
+    same vectors in every process."""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def features(self, text: str) -> list[str]:
+        words = _WORD.findall(text.lower())
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self.features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (rows, cols), signs)
+        return matrix
+
+
+class AgentPreselector:
+    """Picks the top_k agents of the directory closest to a query, so that
+    the moderator prompt does not grow with the directory. Descriptions and
+    skills are embedded into one matrix, rebuilt only when the directory
+    changes, and queries are scored with a single matrix product."""
+
+    def __init__(self, directory, top_k: int = 8, embedder: Optional[HashingEmbedder] = None):
+        self.directory = directory
+        self.top_k = top_k
+        self.embedder = embedder or HashingEmbedder()
+
+        self._reloads = None
+        self._names: list[str] = []
+        self._idf = np.ones(self.embedder.dim, dtype=np.float32)
+        self._matrix = np.zeros((0, self.embedder.dim), dtype=np.float32)
+
+        self.builds = 0
+
+    def _normalize(self, matrix: np.ndarray) -> np.ndarray:
+        matrix = matrix * self._idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _refresh(self):
+        agents = self.directory.agents()
+        if self._reloads == self.directory.reloads:
+            return
+        self._reloads = self.directory.reloads
+
+        skills = self.directory.skills()
+        self._names = list(agents)
+        texts = [
+            f"{name.replace('-', ' ')} {agents[name]} {skills.get(name, '')}"
+            for name in self._names
+        ]
+        counts = self.embedder.embed(texts)
+
+        # buckets shared by many agents tell them apart less
+        df = np.count_nonzero(counts, axis=0)
+        self._idf = (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+        self._matrix = self._normalize(counts)
+        self.builds += 1
+
+    def select_many(self, queries: list[str]) -> list[dict[str, str]]:
+        self._refresh()
+        agents = self.directory.agents()
+        if not self.top_k or len(self._names) <= self.top_k:
+            return [agents for _ in queries]
+
+        scores = self._normalize(self.embedder.embed(queries)) @ self._matrix.T
+        top = np.argpartition(-scores, self.top_k - 1, axis=1)[:, : self.top_k]
+
+        # keep the directory order, so that the prompt only changes when the
+        # selection does
+        return [
+            {self._names[i]: agents[self._names[i]] for i in sorted(row)}
+            for row in top.tolist()
+        ]
+
+    def select(self, query: str) -> dict[str, str]:
+        return self.select_many([query])[0]
@@ -0,0 +1,77 @@
+import collections
+from typing import Iterable, Optional
+
+from agp.text import normalize
+
+GREETINGS = (
+    "hi",
+    "hello",
+    "hey",
+    "hi there",
+    "hello there",
+    "good morning",
+    "good afternoon",
+    "good evening",
+)
+GREETING_REPLY = "Hello, how can I help?"
+
+
+class FastPathRouter:
+    """Answers the messages whose handling is mechanical without asking the
+    LLM. Rules are tried in order and the first one that matches answers,
+    when none matches route returns None and the LLM decides.
+
+    - agent-answered: an agent invited to the conversation spoke, the turn
+      goes back to the user
+    - greeting: the user only said hello, the moderator greets back"""
+
+    def __init__(
+        self,
+        rules: Iterable[str] = ("agent-answered", "greeting"),
+        greetings: Iterable[str] = GREETINGS,
+        greeting_reply: str = GREETING_REPLY,
+    ):
+        self.rules = []
+        for name in rules:
+            if name not in RULES:
+                raise ValueError(f"Fast path rules must be among {', '.join(RULES)}")
+            self.rules.append((name, getattr(self, RULES[name])))
+        self.greetings = {normalize(greeting) for greeting in greetings}
+        self.greeting_reply = greeting_reply
+
+        self.hits: collections.Counter = collections.Counter()
+
+    def route(self, message: dict, conversation) -> Optional[dict]:
+        if message.get("type") != "ChatMessage":
+            return None
+        for name, rule in self.rules:
+            answers = rule(message, conversation)
+            if answers is not None:
+                self.hits[name] += 1
+                conversation.llm_calls_avoided += 1
+                return {"messages": answers}
+        return None
+
+    def _agent_answered(self, message: dict, conversation) -> Optional[list[dict]]:
+        if message["author"] not in conversation.agents:
+            return None
+        return [{"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"}]
+
+    def _greeting(self, message: dict, conversation) -> Optional[list[dict]]:
+        if message["author"] != "user-proxy":
+            return None
+        if normalize(message.get("message", "")) not in self.greetings:
+            return None
+        return [
+            {"type": "ChatMessage", "author": "moderator", "message": self.greeting_reply},
+            {"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"},
+        ]
+
+    def stats(self) -> dict:
+        return dict(self.hits)
+
+
+RULES = {
+    "agent-answered": "_agent_answered",
+    "greeting": "_greeting",
+}
@@ -0,0 +1,74 @@
+import json
+import re
+
+from langchain_core.exceptions import OutputParserException
+
+_MESSAGES = re.compile(r'"messages"\s*:\s*\[')
+
+
+class MessageStreamParser:
+    """Incremental parser of the moderator answer,
+    {"messages": [{...}, {...}]}. Chunks of the LLM output are fed as they
+    arrive, and every element of messages is returned as soon as its closing
+    brace has been read, while the rest of the answer is still generated."""
+
+    def __init__(self):
+        self.text = ""
+        self.parsed = 0
+
+        # scanner state, inside the messages array
+        self._pos = None
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escaped = False
+        self._closed = False
+
+    def feed(self, chunk: str) -> list[dict]:
+        self.text += chunk
+        if self._pos is None:
+            match = _MESSAGES.search(self.text)
+            if match is None:
+                return []
+            self._pos = match.end()
+
+        messages = []
+        text = self.text
+        while self._pos < len(text) and not self._closed:
+            char = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0 and char == "]":
+                    self._closed = True
+                elif self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        messages.append(self._parse(text[self._start : self._pos + 1]))
+            self._pos += 1
+        return messages
+
+    def _parse(self, text: str) -> dict:
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise OutputParserException(f"Invalid message in moderator answer: {e}", llm_output=self.text)
+        if not isinstance(message, dict) or "type" not in message:
+            raise OutputParserException(f"Invalid message in moderator answer: {text}", llm_output=self.text)
+        self.parsed += 1
+        return message
+
+    def close(self):
+        if not self._closed:
+            raise OutputParserException("Incomplete moderator answer", llm_output=self.text)
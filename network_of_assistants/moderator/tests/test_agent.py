@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from agent import ModeratorAgent
+
+INPUT = {
+    "agents_list": "- pdf-assistant: Answers questions about the documents",
+    "chat_agent_list": "",
+    "chat_summary": "None",
+    "chat_history": [],
+    "query_message": {"type": "ChatMessage", "author": "user-proxy", "message": "What is a VLAN?"},
+}
+
+INVITE = {"type": "InviteToChat", "author": "moderator", "target": "pdf-assistant", "summary": "VLANs"}
+REQUEST = {"type": "RequestToSpeak", "author": "moderator", "target": "pdf-assistant"}
+
+
+async def read(moderator: ModeratorAgent) -> tuple[list[dict], Exception]:
+    messages = []
+    try:
+        async for message in moderator.amessages(INPUT):
+            messages.append(message)
+    except OutputParserException as e:
+        return messages, e
+    return messages, None
+
+
+def collect(moderator: ModeratorAgent) -> tuple[list[dict], Exception]:
+    return asyncio.run(read(moderator))
+
+
+def collect_merged(moderator: ModeratorAgent) -> list[tuple[list[dict], Exception]]:
+    async def scenario():
+        return await asyncio.gather(read(moderator), read(moderator))
+
+    return asyncio.run(scenario())
+
+
+def test_streamed_answer():
+    answer = json.dumps({"messages": [INVITE, REQUEST]})
+    moderator = ModeratorAgent(llm=FakeListChatModel(responses=[answer]), streaming=True)
+    assert collect(moderator) == ([INVITE, REQUEST], None)
+
+
+def test_request_to_speak_waits_for_the_whole_answer():
+    # the answer breaks after the request to speak has been generated
+    answer = json.dumps({"messages": [INVITE, REQUEST]})[:-2] + ", {oops}]}"
+    moderator = ModeratorAgent(llm=FakeListChatModel(responses=[answer]), streaming=True)
+
+    messages, error = collect(moderator)
+    assert messages == [INVITE]
+    assert isinstance(error, OutputParserException)
+
+
+def test_request_to_speak_is_sent_last():
+    chat = {"type": "ChatMessage", "author": "moderator", "message": "Hello"}
+    answer = json.dumps({"messages": [REQUEST, chat]})
+    moderator = ModeratorAgent(llm=FakeListChatModel(responses=[answer]), streaming=True)
+    assert collect(moderator) == ([chat, REQUEST], None)
+
+
+def test_without_streaming():
+    answer = json.dumps({"messages": [INVITE, REQUEST]})
+    moderator = ModeratorAgent(llm=FakeListChatModel(responses=[answer]))
+    assert collect(moderator) == ([INVITE, REQUEST], None)
+
+
+def test_identical_streamed_calls_are_merged():
+    answer = json.dumps({"messages": [INVITE, REQUEST]})
+    llm = FakeListChatModel(responses=[answer, '{"messages": []}'], sleep=0.001)
+    moderator = ModeratorAgent(llm=llm, streaming=True)
+
+    assert collect_merged(moderator) == [([INVITE, REQUEST], None), ([INVITE, REQUEST], None)]
+    assert moderator.singleflight.stats() == {"calls": 1, "merged": 1, "retried": 0}
+
+
+def test_merged_callers_see_the_failure():
+    answer = json.dumps({"messages": [INVITE, REQUEST]})[:-2] + ", {oops}]}"
+    llm = FakeListChatModel(responses=[answer], sleep=0.001)
+    moderator = ModeratorAgent(llm=llm, streaming=True)
+
+    (leader, leader_error), (follower, follower_error) = collect_merged(moderator)
+    # the caller making the call has streamed the invite, the other one
+    # only gets the failure
+    assert leader == [INVITE]
+    assert follower == []
+    assert isinstance(leader_error, OutputParserException)
+    assert isinstance(follower_error, OutputParserException)
@@ -0,0 +1,62 @@
+from cache import ResponseCache
+
+
+def routing_input(history: list, query: str = "What is the weather?") -> dict:
+    return {
+        "agents_list": "- weather-agent: Answers queries about the weather",
+        "chat_agent_list": "- user-proxy",
+        "chat_history": history,
+        "query_message": {"type": "ChatMessage", "author": "user-proxy", "message": query},
+    }
+
+
+def test_key_only_depends_on_the_recent_history():
+    cache = ResponseCache(history_messages=2)
+    old = [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert cache.key(routing_input(old)) == cache.key(routing_input([{"n": 9}] + old[1:]))
+    assert cache.key(routing_input(old)) != cache.key(routing_input(old[:-1]))
+    assert cache.key(routing_input(old)) != cache.key(routing_input(old, "Is it raining?"))
+
+
+def test_without_history():
+    cache = ResponseCache(history_messages=0)
+    assert cache.key(routing_input([{"n": 0}])) == cache.key(routing_input([]))
+
+
+def test_hits_and_misses():
+    cache = ResponseCache()
+    key = cache.key(routing_input([]))
+    assert cache.get(key) is None
+
+    answer = {"messages": [{"type": "RequestToSpeak", "target": "weather-agent"}]}
+    cache.put(key, answer)
+    assert cache.get(key) == answer
+    assert cache.stats() == {
+        "entries": 1,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+        "hit_rate": 0.5,
+    }
+
+
+def test_answers_are_copied():
+    cache = ResponseCache()
+    answer = {"messages": []}
+    cache.put("key", answer)
+    answer["messages"].append({"type": "ChatMessage"})
+    cache.get("key")["messages"].append({"type": "ChatMessage"})
+    assert cache.get("key") == {"messages": []}
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", {"n": 1})
+    cache.put("b", {"n": 2})
+    cache.get("a")
+    cache.put("c", {"n": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"n": 1}
+    assert len(cache) == 2
+    assert cache.evictions == 1
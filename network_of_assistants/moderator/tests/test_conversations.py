@@ -0,0 +1,51 @@
+from agp.conversations import DEFAULT_CONVERSATION, ConversationStore
+
+from conversations import Conversation
+from history import ChatHistory
+
+
+def chat(author: str, text: str) -> dict:
+    return {"type": "ChatMessage", "author": author, "message": text}
+
+
+def store(**kwargs) -> ConversationStore:
+    return ConversationStore(
+        lambda conversation_id: Conversation(conversation_id, ChatHistory()), **kwargs
+    )
+
+
+def test_conversations_are_kept_apart():
+    conversations = store()
+    first = conversations.get("first")
+    first.history.append(chat("user-proxy", "What is a VLAN?"))
+    first.agents.add("pdf-assistant")
+
+    second = conversations.get("second")
+    assert second.id == "second"
+    assert len(second.history) == 0
+    assert second.agents == set()
+
+    assert conversations.get("first") is first
+    assert len(first.history) == 1
+    assert conversations.stats()["conversations"] == 2
+
+
+def test_messages_without_id_share_the_default_conversation():
+    conversations = store()
+    conversation = conversations.get(None)
+    assert conversation.id == DEFAULT_CONVERSATION
+    assert conversations.get(None) is conversation
+
+
+def test_idle_conversations_start_over():
+    conversations = store(shards=1, idle_ttl=60.0)
+    conversation = conversations.get("first")
+    conversation.history.append(chat("user-proxy", "Hello"))
+    conversation.llm_calls_avoided += 1
+
+    # an hour later, the history and invited agents are gone
+    conversations.sweep(now=conversations.shards[0]["first"][0] + 3600)
+    conversation = conversations.get("first")
+    assert len(conversation.history) == 0
+    assert conversation.llm_calls_avoided == 0
+    assert conversations.stats()["expired"] == 1
@@ -0,0 +1,59 @@
+import json
+import os
+
+from directory import AgentDirectory, agent_id, agents_to_string
+
+
+def write_agent(path, name: str, description: str):
+    data = {
+        "name": name,
+        "description": description,
+        "skills": [{"class_name": "Search", "category_name": "Retrieval"}],
+    }
+    path.write_text(json.dumps(data))
+
+
+def test_agent_id():
+    assert agent_id(" Nexus Assistant ") == "nexus-assistant"
+
+
+def test_agents_and_skills(tmp_path):
+    write_agent(tmp_path / "b.json", "Weather Agent", "Answers weather questions")
+    write_agent(tmp_path / "a.json", "Math Agent", "Solves equations")
+    (tmp_path / "notes.txt").write_text("not an agent")
+    directory = AgentDirectory(str(tmp_path), check_interval=0)
+
+    assert directory.agents() == {
+        "math-agent": "Solves equations",
+        "weather-agent": "Answers weather questions",
+    }
+    assert directory.skills()["math-agent"] == "Search (Retrieval)"
+    assert directory.agents_string() == agents_to_string(directory.agents())
+    assert directory.subset({"math-agent"}) == {"math-agent": "Solves equations"}
+
+
+def test_unchanged_files_are_not_reloaded(tmp_path):
+    write_agent(tmp_path / "a.json", "Math Agent", "Solves equations")
+    directory = AgentDirectory(str(tmp_path), check_interval=0)
+    directory.agents()
+    directory.agents()
+    assert directory.reloads == 1
+
+    write_agent(tmp_path / "a.json", "Math Agent", "Solves equations and integrals")
+    os.utime(tmp_path / "a.json", ns=(1, 1))
+    assert directory.agents() == {"math-agent": "Solves equations and integrals"}
+    assert directory.reloads == 2
+
+
+def test_invalid_files_are_only_reported_once(tmp_path, capsys):
+    write_agent(tmp_path / "a.json", "Math Agent", "Solves equations")
+    (tmp_path / "broken.json").write_text("{not json")
+    directory = AgentDirectory(str(tmp_path), check_interval=0)
+
+    for _ in range(3):
+        assert list(directory.agents()) == ["math-agent"]
+    assert capsys.readouterr().out.count("broken.json") == 1
+
+    write_agent(tmp_path / "broken.json", "Weather Agent", "Answers weather questions")
+    os.utime(tmp_path / "broken.json", ns=(1, 1))
+    assert list(directory.agents()) == ["math-agent", "weather-agent"]
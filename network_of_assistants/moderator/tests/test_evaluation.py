@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+from langchain_core.messages import AIMessage
+
+from evaluation import EvaluationPipeline, parse_score
+
+
+class FakeEvaluator:
+    async def abatch(self, inputs: list[dict]) -> list:
+        return [
+            ValueError("no rating") if input["moderator_answer"] == "broken" else AIMessage(content="1")
+            for input in inputs
+        ]
+
+
+def evaluation_input(answer: str) -> dict:
+    return {"query_message": {"type": "ChatMessage"}, "moderator_answer": answer}
+
+
+def test_parse_score():
+    assert parse_score("NA") is None
+    assert parse_score("0") == 0
+    assert parse_score("1") == 1
+
+
+def test_scores_are_appended_to_the_log(tmp_path):
+    path = tmp_path / "scores.jsonl"
+
+    async def scenario():
+        pipeline = EvaluationPipeline(FakeEvaluator(), scores_path=str(path), batch_size=2)
+        pipeline.start()
+        for answer in ("a", "broken", "b", "c"):
+            pipeline.submit(evaluation_input(answer))
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert sorted(record["moderator_answer"] for record in records) == ["a", "b", "c"]
+    assert all(record["score"] == 1 for record in records)
+    assert pipeline.stats()["evaluated"] == 3
+    assert pipeline.stats()["errors"] == 1
+    assert pipeline.stats()["scores"] == {"0": 0, "1": 3, "NA": 0}
+
+
+def test_sampling():
+    async def scenario():
+        pipeline = EvaluationPipeline(FakeEvaluator(), sample_rate=0.0)
+        assert not pipeline.submit(evaluation_input("a"))
+        return pipeline
+
+    assert asyncio.run(scenario()).skipped == 1
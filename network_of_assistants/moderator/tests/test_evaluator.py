@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from evaluator import EvaluatorAgent, parse_ratings
+from limits import LLMLimiter
+
+EVALUATION_INPUT = {
+    "agents_list": "- weather-agent: Answers queries about the weather",
+    "chat_summary": "None",
+    "chat_history": [],
+    "query_message": {"type": "ChatMessage", "author": "user-proxy", "message": "Weather?"},
+    "moderator_answer": '{"messages": []}',
+}
+
+
+def test_parse_ratings():
+    content = "Answer 1: 1\n2) NA\n3 - 0\nsome commentary\n9: 1"
+    assert parse_ratings(content, 3) == {0: "1", 1: "NA", 2: "0"}
+
+
+def test_abatch_rates_all_inputs_in_one_call():
+    llm = FakeListChatModel(responses=["1: 1\n2: 0\n3: NA"])
+    evaluator = EvaluatorAgent(llm=llm)
+    inputs = [dict(EVALUATION_INPUT, chat_summary=str(i)) for i in range(3)]
+
+    results = asyncio.run(evaluator.abatch(inputs))
+
+    assert [result.content for result in results] == ["1", "0", "NA"]
+    assert evaluator.stats() == {"batches": 1, "batched_answers": 3, "unbatched_answers": 0}
+
+
+def test_abatch_rates_missing_answers_on_their_own():
+    llm = FakeListChatModel(responses=["1: 1", "0"])
+    evaluator = EvaluatorAgent(llm=llm)
+    inputs = [dict(EVALUATION_INPUT, chat_summary=str(i)) for i in range(2)]
+
+    results = asyncio.run(evaluator.abatch(inputs))
+
+    assert [result.content for result in results] == ["1", "0"]
+    assert evaluator.stats()["unbatched_answers"] == 1
+
+
+def test_shared_limiter_has_its_own_slots():
+    async def scenario():
+        limiter = LLMLimiter(max_concurrency=1, requests_per_minute=600)
+        shared = limiter.share(max_concurrency=1)
+        assert shared.requests is limiter.requests
+
+        # both hold a slot at the same time
+        async with limiter.slot():
+            async with asyncio.timeout(1):
+                async with shared.slot():
+                    pass
+
+    asyncio.run(scenario())
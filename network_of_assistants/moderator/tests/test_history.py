@@ -0,0 +1,61 @@
+from agp.text import count_tokens
+
+from history import ChatHistory, render_input, summarize_message
+
+
+def chat(author: str, text: str) -> dict:
+    return {"type": "ChatMessage", "author": author, "message": text}
+
+
+def test_summarize_message():
+    assert summarize_message(chat("user-proxy", "Hello")) == "user-proxy: Hello"
+    invite = {"type": "InviteToChat", "author": "moderator", "target": "pdf", "summary": "VLANs"}
+    assert summarize_message(invite) == "moderator invited pdf: VLANs"
+    request = {"type": "RequestToSpeak", "author": "moderator", "target": "pdf"}
+    assert summarize_message(request) == "moderator asked pdf to speak"
+
+
+def test_render_input_is_stable():
+    input = {"chat_history": [chat("a", "x")], "query_message": chat("b", "y"), "agents": "-"}
+    assert render_input(input) == render_input(dict(input))
+    assert render_input(input)["agents"] == "-"
+    assert isinstance(render_input(input)["chat_history"], str)
+
+
+def test_recent_messages_are_kept_verbatim():
+    history = ChatHistory(token_budget=10_000, keep_last=3)
+    for n in range(5):
+        history.append(chat("user-proxy", f"message {n}"))
+
+    assert len(history) == 5
+    assert [m["message"] for m in history.messages()] == ["message 2", "message 3", "message 4"]
+    assert history.summary() == "user-proxy: message 0\nuser-proxy: message 1"
+    assert history.folded_messages == 2
+
+
+def test_empty_summary():
+    history = ChatHistory()
+    history.append(chat("user-proxy", "hi"))
+    assert history.summary() == "None"
+
+
+def test_token_budget():
+    history = ChatHistory(token_budget=400, keep_last=3)
+    for n in range(50):
+        history.append(chat("user-proxy", f"message {n} " + "x" * 100))
+
+    assert history.prompt_tokens() <= 400
+    assert history.dropped_lines > 0
+    assert history.summary().startswith("(earlier messages omitted)")
+    assert history.messages()[-1]["message"].startswith("message 49")
+
+    stats = history.stats()
+    assert stats["messages"] == 50
+    assert stats["tokens_saved"] == stats["full_history_tokens"] - stats["prompt_tokens"]
+
+
+def test_newest_message_is_kept_whatever_its_size():
+    history = ChatHistory(token_budget=10)
+    history.append(chat("user-proxy", "x" * 1000))
+    assert len(history.messages()) == 1
+    assert history.prompt_tokens() > count_tokens("x" * 1000)
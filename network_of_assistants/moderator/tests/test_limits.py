@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from limits import LLMLimiter, SingleFlight, TokenBucket, prompt_key
+
+
+def test_prompt_key_ignores_key_order():
+    assert prompt_key({"a": 1, "b": 2}) == prompt_key({"b": 2, "a": 1})
+
+
+def test_token_bucket_waits_for_refill():
+    async def scenario():
+        bucket = TokenBucket(rate_per_minute=600, capacity=1)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await bucket.acquire()
+        await bucket.acquire()
+        return loop.time() - start
+
+    # 10 per second, the second unit waits about 0.1s
+    assert asyncio.run(scenario()) >= 0.05
+
+
+def test_limiter_caps_concurrency():
+    async def scenario():
+        limiter = LLMLimiter(max_concurrency=2)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(6)))
+        return peak, limiter.stats()
+
+    peak, stats = asyncio.run(scenario())
+    assert peak == 2
+    assert stats["calls"] == 6
+    assert stats["waiting"] == 0
+
+
+def test_singleflight_merges_calls():
+    async def scenario():
+        singleflight = SingleFlight()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(singleflight.do("key", fn) for _ in range(3)))
+        return results, calls, singleflight.stats()
+
+    results, calls, stats = asyncio.run(scenario())
+    assert results == ["answer"] * 3
+    assert calls == 1
+    assert stats["merged"] == 2
+
+
+def test_singleflight_followers_retry_when_the_call_is_cancelled():
+    async def scenario():
+        singleflight = SingleFlight()
+        started = asyncio.Event()
+        calls = 0
+
+        async def fn():
+            nonlocal calls
+            calls += 1
+            started.set()
+            await asyncio.sleep(0.05)
+            return calls
+
+        leader = asyncio.create_task(singleflight.do("key", fn))
+        await started.wait()
+        follower = asyncio.create_task(singleflight.do("key", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # the follower made the call again instead of being cancelled
+        assert await follower == 2
+        assert singleflight.stats()["retried"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_singleflight_shares_errors():
+    async def scenario():
+        singleflight = SingleFlight()
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("provider error")
+
+        return await asyncio.gather(
+            *(singleflight.do("key", fn) for _ in range(2)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
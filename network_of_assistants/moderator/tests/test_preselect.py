@@ -0,0 +1,74 @@
+import numpy as np
+
+from preselect import AgentPreselector, HashingEmbedder
+
+AGENTS = {
+    "weather-agent": "Answers queries about the weather",
+    "math-agent": "Provides answers to mathematical problems",
+    "financial-agent": "Answers financial questions about stocks and markets",
+    "pdf-assistant": "Searches the networking documentation",
+}
+
+
+class Directory:
+    # the part of AgentDirectory the preselector uses
+    def __init__(self, agents: dict[str, str], skills: dict[str, str] = None):
+        self._agents = dict(agents)
+        self._skills = skills or {}
+        self.reloads = 0
+
+    def agents(self) -> dict[str, str]:
+        return self._agents
+
+    def skills(self) -> dict[str, str]:
+        return self._skills
+
+    def reload(self, agents: dict[str, str]):
+        self._agents = dict(agents)
+        self.reloads += 1
+
+
+def test_embeddings_are_deterministic():
+    embedder = HashingEmbedder(dim=64)
+    first = embedder.embed(["rain in New York", "rain in New York"])
+    assert first.shape == (2, 64)
+    assert np.array_equal(first[0], first[1])
+    assert np.array_equal(HashingEmbedder(dim=64).embed(["rain in New York"])[0], first[0])
+    assert embedder.features("Rain, in NY") == ["rain", "in", "ny", "rain in", "in ny"]
+
+
+def test_select_top_k():
+    preselector = AgentPreselector(Directory(AGENTS), top_k=2)
+    selected = preselector.select("What is the weather like in New York?")
+    assert len(selected) == 2
+    assert selected["weather-agent"] == AGENTS["weather-agent"]
+
+    # several queries are scored at once, selections keep the directory order
+    many = preselector.select_many(["stocks markets", "networking documentation"])
+    assert "financial-agent" in many[0]
+    assert "pdf-assistant" in many[1]
+    for selection in many:
+        assert list(selection) == [name for name in AGENTS if name in selection]
+
+
+def test_skills_are_matched():
+    skills = {"pdf-assistant": "vlan trunking spanning tree"}
+    preselector = AgentPreselector(Directory(AGENTS, skills), top_k=1)
+    assert list(preselector.select("How do I configure a VLAN trunk?")) == ["pdf-assistant"]
+
+
+def test_small_directories_are_not_filtered():
+    assert AgentPreselector(Directory(AGENTS), top_k=8).select("anything") == AGENTS
+    assert AgentPreselector(Directory(AGENTS), top_k=0).select("anything") == AGENTS
+
+
+def test_rebuilt_only_on_reload():
+    directory = Directory(AGENTS)
+    preselector = AgentPreselector(directory, top_k=2)
+    preselector.select("weather")
+    preselector.select("markets")
+    assert preselector.builds == 1
+
+    directory.reload({**AGENTS, "travel-agent": "Books flights and hotels"})
+    assert "travel-agent" in preselector.select("book a flight and a hotel")
+    assert preselector.builds == 2
@@ -0,0 +1,67 @@
+import pytest
+
+from conversations import Conversation
+from history import ChatHistory
+from router import GREETING_REPLY, FastPathRouter
+
+BACK_TO_USER = {"type": "RequestToSpeak", "author": "moderator", "target": "user-proxy"}
+
+
+def chat(author: str, text: str) -> dict:
+    return {"type": "ChatMessage", "author": author, "message": text}
+
+
+def conversation() -> Conversation:
+    conversation = Conversation("first", ChatHistory())
+    conversation.agents.add("pdf-assistant")
+    return conversation
+
+
+def test_agent_answer_goes_back_to_the_user():
+    router, c = FastPathRouter(), conversation()
+    answer = router.route(chat("pdf-assistant", "A VLAN is a broadcast domain."), c)
+    assert answer == {"messages": [BACK_TO_USER]}
+    assert c.llm_calls_avoided == 1
+    assert router.stats() == {"agent-answered": 1}
+
+
+def test_agents_not_in_the_conversation_go_to_the_llm():
+    router, c = FastPathRouter(), conversation()
+    assert router.route(chat("math-assistant", "42"), c) is None
+    assert c.llm_calls_avoided == 0
+    assert router.stats() == {}
+
+
+def test_greeting():
+    router, c = FastPathRouter(), conversation()
+    for text in ("Hello!", "  hi THERE ", "Good morning."):
+        answer = router.route(chat("user-proxy", text), c)
+        assert answer == {
+            "messages": [
+                {"type": "ChatMessage", "author": "moderator", "message": GREETING_REPLY},
+                BACK_TO_USER,
+            ]
+        }
+    assert router.stats() == {"greeting": 3}
+
+    # anything more than a greeting is for the LLM
+    assert router.route(chat("user-proxy", "Hello, what is a VLAN?"), c) is None
+    # only the user is greeted back
+    assert router.route(chat("someone", "Hello"), c) is None
+
+
+def test_only_chat_messages_are_routed():
+    router, c = FastPathRouter(), conversation()
+    invite = {"type": "InviteToChat", "author": "pdf-assistant", "target": "x", "summary": ""}
+    assert router.route(invite, c) is None
+
+
+def test_rules():
+    c = conversation()
+    router = FastPathRouter(rules=["greeting"], greeting_reply="Hey")
+    assert router.route(chat("pdf-assistant", "Done."), c) is None
+    assert router.route(chat("user-proxy", "hey"), c)["messages"][0]["message"] == "Hey"
+
+    assert FastPathRouter(rules=[]).route(chat("user-proxy", "hi"), c) is None
+    with pytest.raises(ValueError):
+        FastPathRouter(rules=["unknown"])
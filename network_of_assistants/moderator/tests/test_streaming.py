@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from langchain_core.exceptions import OutputParserException
+
+from streaming import MessageStreamParser
+
+ANSWER = json.dumps(
+    {
+        "messages": [
+            {"type": "ChatMessage", "author": "moderator", "message": 'say "{hi}" [now]\\'},
+            {"type": "RequestToSpeak", "author": "moderator", "target": "pdf", "extra": [{}]},
+        ]
+    }
+)
+
+
+def feed_all(parser: MessageStreamParser, chunks) -> list[list[dict]]:
+    return [parser.feed(chunk) for chunk in chunks]
+
+
+def test_messages_are_returned_as_soon_as_they_are_complete():
+    parser = MessageStreamParser()
+    first_end = ANSWER.index("}, {") + 1
+    chunks = [ANSWER[: first_end - 1], ANSWER[first_end - 1 : first_end], ANSWER[first_end:]]
+    results = feed_all(parser, chunks)
+    parser.close()
+
+    expected = json.loads(ANSWER)["messages"]
+    assert results == [[], [expected[0]], [expected[1]]]
+    assert parser.parsed == 2
+
+
+def test_one_character_at_a_time():
+    parser = MessageStreamParser()
+    messages = [message for result in feed_all(parser, ANSWER) for message in result]
+    parser.close()
+    assert messages == json.loads(ANSWER)["messages"]
+
+
+def test_text_before_the_answer_is_skipped():
+    parser = MessageStreamParser()
+    assert parser.feed("Sure, here it is:\n```json\n") == []
+    assert len(parser.feed(ANSWER)) == 2
+    parser.close()
+
+
+def test_incomplete_answer():
+    parser = MessageStreamParser()
+    parser.feed(ANSWER[:-3])
+    with pytest.raises(OutputParserException):
+        parser.close()
+
+
+def test_message_without_type():
+    parser = MessageStreamParser()
+    with pytest.raises(OutputParserException):
+        parser.feed('{"messages": [{"author": "moderator"}]}')
@@ -0,0 +1,180 @@
+import asyncio
+import collections
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from agp.text import normalize
+
+
+def context_digest(messages: list) -> str:
+    # what the agent run answers from, for questions that depend on it
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.role}\n{message.content}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """Answers of the assistant keyed by the normalized question, the digest
+    of the conversation it depends on (empty for standalone questions) and
+    the version of the index they were found in. An LRU of max_entries is
+    kept in memory in front of a SQLite file, so that answers survive
+    restarts. Answers older than ttl seconds are not served, and
+    invalidate() drops those of every other index version once a new one is
+    swapped in.
+
+    The SQLite file is only touched from one thread of its own: lookups that
+    miss the memory are awaited, and writes are queued and committed in
+    batches, so the event loop never waits for the disk."""
+
+    def __init__(self, path: str, max_entries: int = 1024, ttl: float = 86400.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> version, answer, creation time
+        self._entries: collections.OrderedDict[str, tuple] = collections.OrderedDict()
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="answers")
+        self._executor.submit(self._open, path).result()
+        # statements waiting for the next commit
+        self._writes: list[tuple[str, tuple]] = []
+        self._flush_scheduled = False
+        self._lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidated = 0
+        self.commits = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, question: str, version: str, context: str = "") -> str:
+        data = f"{version}\n{context}\n{normalize(question)}"
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    async def get(self, question: str, version: str, context: str = "") -> Optional[str]:
+        key = self.key(question, version, context)
+        entry = self._entries.get(key)
+        from_disk = False
+        if entry is None:
+            entry = await self._run(self._read, key)
+            if entry is not None:
+                from_disk = True
+                self._remember(key, entry)
+
+        if entry is None:
+            self.misses += 1
+            return None
+        _, answer, created = entry
+        if self.ttl and time.time() - created > self.ttl:
+            self._entries.pop(key, None)
+            self._write("DELETE FROM answers WHERE key = ?", (key,))
+            self.expired += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.disk_hits += from_disk
+        return answer
+
+    def put(self, question: str, version: str, answer: str, context: str = ""):
+        key = self.key(question, version, context)
+        created = time.time()
+        self._remember(key, (version, answer, created))
+        self._write(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?)",
+            (key, version, normalize(question), answer, created),
+        )
+
+    def _remember(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def invalidate(self, version: str):
+        # answers found in other versions of the index may be outdated
+        for key in [key for key, entry in self._entries.items() if entry[0] != version]:
+            del self._entries[key]
+        self.invalidated += await self._run(self._delete_versions, version)
+
+    async def close(self):
+        await self._run(self._close)
+        self._executor.shutdown()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidated": self.invalidated,
+            "commits": self.commits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def _run(self, fn, *args):
+        # the executor runs jobs in order, so a read sees every write queued
+        # before it
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _write(self, statement: str, parameters: tuple):
+        with self._lock:
+            self._writes.append((statement, parameters))
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        self._executor.submit(self._flush)
+
+    # the methods below run on the executor thread
+
+    def _open(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, version TEXT, question TEXT, answer TEXT, created REAL)"
+        )
+        self.db.commit()
+
+    def _flush(self):
+        # everything queued since the last commit goes in one transaction
+        with self._lock:
+            writes, self._writes = self._writes, []
+            self._flush_scheduled = False
+        if not writes:
+            return
+        for statement, parameters in writes:
+            self.db.execute(statement, parameters)
+        self.db.commit()
+        self.commits += 1
+
+    def _read(self, key: str) -> Optional[tuple]:
+        self._flush()
+        row = self.db.execute(
+            "SELECT version, answer, created FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        return tuple(row) if row is not None else None
+
+    def _delete_versions(self, version: str) -> int:
+        self._flush()
+        cursor = self.db.execute("DELETE FROM answers WHERE version != ?", (version,))
+        self.db.commit()
+        self.commits += 1
+        return cursor.rowcount
+
+    def _close(self):
+        self._flush()
+        self.db.close()
@@ -0,0 +1,157 @@
+import os
+import re
+import time
+from typing import Optional
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+_WORD = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+# kept short and local, so that no corpus has to be downloaded
+STOPWORDS = frozenset(
+    """a an and are as at be but by can do does for from has have how i if in
+    into is it its me my no not of on or our so that the their then there these
+    this to was we what when where which who why will with you your""".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in _WORD.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a list of texts. The postings of every term are slices
+    of two flat arrays, document ids and term frequencies, so a query only
+    touches the postings of its terms and scores them with NumPy."""
+
+    def __init__(self, texts: list[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        vocabulary: dict[str, int] = {}
+        terms, docs, tfs = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for doc, text in enumerate(texts):
+            counts: dict[int, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                term = vocabulary.setdefault(token, len(vocabulary))
+                counts[term] = counts.get(term, 0) + 1
+            lengths[doc] = len(tokens)
+            terms.extend(counts)
+            docs.extend([doc] * len(counts))
+            tfs.extend(counts.values())
+
+        # postings sorted by term, offsets[t]:offsets[t + 1] are those of t
+        terms = np.asarray(terms, dtype=np.int32)
+        order = np.argsort(terms, kind="stable")
+        self.doc_ids = np.asarray(docs, dtype=np.int32)[order]
+        self.tfs = np.asarray(tfs, dtype=np.float32)[order]
+        df = np.bincount(terms, minlength=len(vocabulary))
+        self.offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.offsets[1:])
+
+        self.vocabulary = vocabulary
+        self.size = len(texts)
+        self.idf = np.log(1 + (self.size - df + 0.5) / (df + 0.5)).astype(np.float32)
+        average = lengths.mean() if self.size else 0.0
+        # per document part of the BM25 denominator
+        self.norms = (k1 * (1 - b + b * lengths / max(average, 1e-9))).astype(np.float32)
+
+    def save(self, path: str, node_ids: list[str]):
+        # node_ids are those of the texts, in order, so that a loaded index
+        # is only used with the nodes it was built from
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        np.savez(
+            path,
+            params=np.asarray([self.k1, self.b]),
+            terms=np.asarray(terms, dtype=str),
+            node_ids=np.asarray(node_ids, dtype=str),
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            offsets=self.offsets,
+            idf=self.idf,
+            norms=self.norms,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> tuple["BM25Index", list[str]]:
+        with np.load(path) as arrays:
+            index = cls.__new__(cls)
+            index.k1, index.b = (float(value) for value in arrays["params"])
+            index.vocabulary = {term: i for i, term in enumerate(arrays["terms"].tolist())}
+            index.doc_ids = arrays["doc_ids"]
+            index.tfs = arrays["tfs"]
+            index.offsets = arrays["offsets"]
+            index.idf = arrays["idf"]
+            index.norms = arrays["norms"]
+            index.size = len(index.norms)
+            return index, arrays["node_ids"].tolist()
+
+    def search(self, query: str, top_k: int = 5) -> list[tuple[int, float]]:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for token in set(tokenize(query)):
+            term = self.vocabulary.get(token)
+            if term is None:
+                continue
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs, tfs = self.doc_ids[start:end], self.tfs[start:end]
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.norms[docs])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > top_k:
+            matches = matches[np.argpartition(-scores[matches], top_k - 1)[:top_k]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(int(doc), float(scores[doc])) for doc in matches]
+
+
+class BM25Retriever(BaseRetriever):
+    """Retrieves the nodes of a docstore with BM25, without calling the LLM
+    to extract keywords, neither when building nor when querying. A
+    persisted index is used as it is when it was built from the same nodes."""
+
+    def __init__(
+        self,
+        nodes: list,
+        similarity_top_k: int = 5,
+        k1: float = 1.2,
+        b: float = 0.75,
+        index: Optional[BM25Index] = None,
+        docstore=None,
+    ):
+        self.nodes = nodes
+        self.similarity_top_k = similarity_top_k
+        self.docstore = docstore
+        if index is None:
+            start = time.monotonic()
+            index = BM25Index([node.get_content() for node in nodes], k1=k1, b=b)
+            print(
+                f"Built the BM25 index of {len(nodes)} nodes and "
+                f"{len(index.vocabulary)} terms in {time.monotonic() - start:.2f}s"
+            )
+        self.index = index
+        super().__init__()
+
+    @classmethod
+    def from_docstore(
+        cls, docstore, similarity_top_k: int = 5, persisted: Optional[str] = None
+    ) -> "BM25Retriever":
+        nodes = sorted(docstore.docs.values(), key=lambda node: node.node_id)
+        index = None
+        if persisted is not None and os.path.exists(persisted):
+            index, node_ids = BM25Index.load(persisted)
+            if node_ids != [node.node_id for node in nodes]:
+                print(f"The BM25 index in {persisted} is outdated, rebuilding it")
+                index = None
+        return cls(nodes, similarity_top_k=similarity_top_k, index=index, docstore=docstore)
+
+    def save(self, path: str):
+        self.index.save(path, [node.node_id for node in self.nodes])
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return [
+            NodeWithScore(node=self.nodes[doc], score=score)
+            for doc, score in self.index.search(query_bundle.query_str, self.similarity_top_k)
+        ]
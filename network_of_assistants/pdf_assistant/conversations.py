@@ -0,0 +1,13 @@
+from typing import Optional
+
+from memory import TurnMemory
+
+
+class Conversation:
+    def __init__(self, conversation_id: str, memory: TurnMemory):
+        self.id = conversation_id
+        self.memory = memory
+        # last chat message from someone else and its author, what a request
+        # to speak answers
+        self.question: Optional[str] = None
+        self.asker: Optional[str] = None
@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from pypdf import PdfReader
+
+# like SimpleDirectoryReader, only the file path goes into the LLM prompts
+EXCLUDED_METADATA = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
+
+def _pdf_documents(path: str, first: int, last: int) -> list[Document]:
+    reader = PdfReader(path)
+    metadata = default_file_metadata_func(path)
+    docs = []
+    for page in range(first, last):
+        doc = Document(
+            text=reader.pages[page].extract_text(),
+            metadata={"page_label": reader.page_labels[page], **metadata},
+            excluded_embed_metadata_keys=list(EXCLUDED_METADATA),
+            excluded_llm_metadata_keys=list(EXCLUDED_METADATA),
+        )
+        # the ids SimpleDirectoryReader gives with filename_as_id
+        doc.id_ = f"{path}_part_{page}"
+        docs.append(doc)
+    return docs
+
+
+def _ingest(task: tuple) -> tuple[str, int, list]:
+    # runs in the worker processes, the splitter is rebuilt from its class and
+    # settings as its tokenizers do not pickle
+    path, pages, splitter_class, splitter_settings = task
+    if pages is None:
+        docs = SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+        count = len(docs)
+    else:
+        docs = _pdf_documents(path, *pages)
+        count = pages[1] - pages[0]
+    splitter = splitter_class(**splitter_settings)
+    return path, count, splitter.get_nodes_from_documents(docs)
+
+
+def plan(paths: list[str], pages_per_task: int) -> list[tuple[str, Optional[tuple[int, int]]]]:
+    # large PDFs are split into page ranges, any other file is one task
+    tasks = []
+    for path in paths:
+        if not path.lower().endswith(".pdf"):
+            tasks.append((path, None))
+            continue
+        pages = len(PdfReader(path).pages)
+        for first in range(0, pages, pages_per_task):
+            tasks.append((path, (first, min(first + pages_per_task, pages))))
+    return tasks
+
+
+def ingest(
+    paths: list[str],
+    splitter,
+    workers: Optional[int] = None,
+    pages_per_task: int = 16,
+) -> dict[str, list]:
+    """Parses and splits the files into nodes on a pool of worker processes,
+    in page ranges for PDFs, and returns the nodes of every file in page
+    order."""
+    start = time.monotonic()
+    workers = workers or os.cpu_count() or 1
+    settings = {"chunk_size": splitter.chunk_size, "chunk_overlap": splitter.chunk_overlap}
+    tasks = [
+        (path, pages, type(splitter), settings) for path, pages in plan(paths, pages_per_task)
+    ]
+
+    if workers == 1 or len(tasks) <= 1:
+        results = map(_ingest, tasks)
+        pool = None
+    else:
+        # spawned rather than forked, the parent runs an event loop and threads
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        results = pool.map(_ingest, tasks)
+
+    nodes = {path: [] for path in paths}
+    pages = 0
+    try:
+        for path, count, file_nodes in results:
+            nodes[path].extend(file_nodes)
+            pages += count
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    elapsed = time.monotonic() - start
+    print(
+        f"Ingested {pages} pages of {len(paths)} files with {workers} workers in "
+        f"{elapsed:.1f}s, {pages / elapsed if elapsed else 0.0:.1f} pages/s"
+    )
+    return nodes
@@ -1,19 +1,38 @@
+import asyncio
 import click
+import collections
 import json
 import os
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core import SimpleKeywordTableIndex
 from llama_index.llms.ollama import Ollama
 from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.core.agent.workflow import ReActAgent
 from llama_index.core.tools import QueryEngineTool
-from llama_index.core import SimpleDirectoryReader
-from llama_index.core.llms import ChatMessage
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.memory import ChatMemoryBuffer
 from agp import AGP
+from agp.conversations import ConversationStore
+from agp.stats import percentile
+from storage import IndexStore
+from watcher import IndexWatcher, VersionedQueryEngine
+from conversations import Conversation
+from memory import TurnMemory
+from answers import AnswerCache, context_digest
 
 
-async def amain(doc_dir, llm_type, llm_endpoint, llm_key, assistant_id):
+async def amain(
+    doc_dir,
+    storage_dir,
+    ingest_workers,
+    retriever,
+    watch_interval,
+    answer_cache_size,
+    answer_cache_ttl,
+    llm_type,
+    llm_endpoint,
+    llm_key,
+    assistant_id,
+):
     if llm_type == "azure":
         kwargs = {
             "engine": "gpt-4o-mini",
@@ -32,16 +51,49 @@ async def amain(doc_dir, llm_type, llm_endpoint, llm_key, assistant_id):
     else:
         raise Exception("LLM type must be azure or ollama")
 
-    reader = SimpleDirectoryReader(input_dir=doc_dir)
-    docs = reader.load_data()
-
+    # the index is persisted in storage_dir, and only rebuilt for the
+    # documents that changed since the last start, which are parsed and split
+    # on ingest_workers processes
     splitter = SentenceSplitter(chunk_size=1024, chunk_overlap=20)
-    index = SimpleKeywordTableIndex.from_documents(
-        docs, transformations=[splitter], llm=llm, show_progress=True
+    store = IndexStore(
+        doc_dir, storage_dir, splitter, llm, workers=ingest_workers, retriever=retriever
     )
+    index = store.load()
+
+    def build_engine(index):
+        # BM25 retrieves without asking the LLM for keywords, which the
+        # keyword table query engine does on every query
+        if retriever == "bm25":
+            return RetrieverQueryEngine.from_args(index, llm=llm)
+        return index.as_query_engine(llm=llm)
+
+    # answers are reused for the same question on the same version of the
+    # index, those found in other versions are dropped
+    answers = None
+    if answer_cache_size:
+        answers = AnswerCache(
+            os.path.join(storage_dir, "answers.sqlite"),
+            max_entries=answer_cache_size,
+            ttl=answer_cache_ttl,
+        )
+        await answers.invalidate(store.version)
+
+    # with a watch interval, changes to doc_dir are indexed while serving,
+    # and the tool switches to the new version of the index once it is built
+    query_engine = VersionedQueryEngine(build_engine(index), store.version)
+    watcher_task = None
+    if watch_interval:
+        watcher = IndexWatcher(
+            store,
+            build_engine,
+            query_engine,
+            interval=watch_interval,
+            on_swap=answers.invalidate if answers is not None else None,
+        )
+        watcher_task = asyncio.create_task(watcher.run())
 
     qet = QueryEngineTool.from_defaults(
-        index.as_query_engine(llm=llm),
+        query_engine,
         name="documentation_search",
         description="Searches the available documentation",
     )
@@ -51,51 +103,171 @@ async def amain(doc_dir, llm_type, llm_endpoint, llm_key, assistant_id):
         agp_endpoint=os.getenv("AGP_ENDPOINT", "http://localhost:12345"),
         local_id=assistant_id,
         shared_space="chat",
+        codec=os.getenv("AGP_CODEC", "json"),
     )
 
     await agp.init()
 
-    memory = ChatMemoryBuffer.from_defaults(token_limit=40000)
+    # one memory per conversation, the least recently used ones are dropped.
+    # It keeps the messages leading to the turns of this assistant, and
+    # summarizes older turns
+    conversations = ConversationStore(
+        lambda conversation_id: Conversation(
+            conversation_id,
+            TurnMemory(
+                token_budget=int(os.getenv("ASSISTANT_MEMORY_TOKENS", "4000")),
+                keep_turns=int(os.getenv("ASSISTANT_MEMORY_TURNS", "4")),
+                max_pending=int(os.getenv("ASSISTANT_MEMORY_PENDING", "8")),
+            ),
+        ),
+        idle_ttl=None,
+        max_conversations=int(os.getenv("ASSISTANT_MAX_CONVERSATIONS", "256")),
+    )
+    # estimated tokens of memory and request every agent run starts from
+    prompt_tokens = collections.deque(maxlen=1024)
+    # bounds the agent runs in flight, the other workers keep recording chat
+    # messages meanwhile
+    runs = asyncio.Semaphore(int(os.getenv("ASSISTANT_MAX_RUNS", "4")))
 
     async def on_message_received(message: bytes):
-        decoded_message = message.decode("utf-8")
-        data = json.loads(decoded_message)
+        data = agp.decode(message)
 
         if data["type"] == "ChatMessage":
             print(f"{data['author']}: {data['message']}")
-            memory.put(
-                ChatMessage(role="user", content=f"{data['author']}: {data['message']}")
-            )
+            # answers of this assistant are recorded with their turn
+            if data["author"] != assistant_id:
+                conversation = conversations.get(data.get("conversation_id"))
+                conversation.memory.put(data["author"], data["message"])
+                conversation.question = data["message"]
+                conversation.asker = data["author"]
 
         elif data["type"] == "RequestToSpeak" and data["target"] == assistant_id:
             print("Moderator requested me to speak")
-            handler = agent.run(user_msg=decoded_message, memory=memory)
-            response = await handler
+            conversation = conversations.get(data.get("conversation_id"))
+            question, version = conversation.question, query_engine.version
+            # a question the user opens the conversation with stands on its
+            # own, any other is only reused in the same conversation state
+            context = ""
+            if answers is not None and question:
+                if conversation.asker != "user-proxy" or conversation.memory.turns:
+                    context = context_digest(conversation.memory.messages())
+
+            answer = None
+            if answers is not None and question:
+                answer = await answers.get(question, version, context)
+            if answer is None:
+                user_msg = json.dumps(data)
+                tokens = conversation.memory.prompt_tokens(user_msg)
+                prompt_tokens.append(tokens)
+                print(f"Running the agent on ~{tokens} prompt tokens of memory and request")
+                # the run gets a buffer of the compacted history, the token
+                # limit is only a safety net
+                memory = ChatMemoryBuffer.from_defaults(
+                    chat_history=conversation.memory.messages(), token_limit=40000
+                )
+                async with runs:
+                    handler = agent.run(user_msg=user_msg, memory=memory)
+                    answer = str(await handler)
+                if answers is not None and question:
+                    answers.put(question, version, answer, context)
+            conversation.memory.record(answer)
+
             # Publish a message to the AGP server
             message = {
                 "type": "ChatMessage",
                 "author": assistant_id,
-                "message": str(response),
+                "message": answer,
             }
-            message_json = json.dumps(message)
-            print(f"Responding with: {str(response)}")
-            await agp.publish(msg=message_json.encode("utf-8"))
+            if "conversation_id" in data:
+                message["conversation_id"] = data["conversation_id"]
+            print(f"Responding with: {answer}")
+            await agp.send(message)
 
-    # Connect to the AGP server and start receiving messages
-    await agp.receive(callback=on_message_received)
-    await agp.receive_task
+    def busy_reply(message: bytes):
+        data = agp.decode(message)
+        if data["type"] != "RequestToSpeak" or data["target"] != assistant_id:
+            return []
+
+        reply = {
+            "type": "ChatMessage",
+            "author": assistant_id,
+            "message": "I am busy right now, please ask me again later.",
+        }
+        if "conversation_id" in data:
+            reply["conversation_id"] = data["conversation_id"]
+        return [agp.encode(reply)]
+
+    # Connect to the AGP server and start receiving messages.
+    # Messages of one conversation are handled in order, different
+    # conversations (or authors, without a conversation id) in parallel
+    await agp.receive(
+        callback=on_message_received,
+        workers=int(os.getenv("ASSISTANT_WORKERS", "8")),
+        stats_interval=float(os.getenv("AGP_STATS_INTERVAL", "0")) or None,
+        max_queue=int(os.getenv("ASSISTANT_MAX_QUEUE", "0")) or None,
+        policy=os.getenv("ASSISTANT_OVERLOAD_POLICY", "block"),
+        busy_reply=busy_reply,
+    )
+    try:
+        await agp.receive_task
+    finally:
+        if watcher_task is not None:
+            watcher_task.cancel()
+            try:
+                await watcher_task
+            except asyncio.CancelledError:
+                pass
+        print(f"Conversation stats: {conversations.stats()}")
+        tokens = sorted(prompt_tokens)
+        print(
+            f"Prompt tokens per run: p50 {percentile(tokens, 0.50)}, "
+            f"p95 {percentile(tokens, 0.95)}, max {tokens[-1] if tokens else 0}"
+        )
+        if answers is not None:
+            print(f"Answer cache stats: {answers.stats()}")
+            await answers.close()
 
 
 @click.command(context_settings={"auto_envvar_prefix": "ASSISTANT"})
 @click.option("--doc-dir", prompt="directory of documentation to load", required=True)
+@click.option("--storage-dir", default="storage", help="directory the index is persisted in")
+@click.option("--ingest-workers", default=None, type=int, help="processes parsing documents")
+@click.option("--retriever", default="bm25", type=click.Choice(["bm25", "keyword"]))
+@click.option("--watch-interval", default=0.0, help="seconds between checks of doc-dir, 0 to not watch")
+@click.option("--answer-cache-size", default=1024, help="answers kept in memory, 0 to not cache")
+@click.option("--answer-cache-ttl", default=86400.0, help="seconds an answer is reused for")
 @click.option("--llm-type", default="azure")
 @click.option("--llm-endpoint", default=None)
 @click.option("--llm-key", default=None)
 @click.option("--assistant-id", required=True)
-def main(doc_dir, llm_type, llm_endpoint, llm_key, assistant_id):
-    import asyncio
-
-    asyncio.run(amain(doc_dir, llm_type, llm_endpoint, llm_key, assistant_id))
+def main(
+    doc_dir,
+    storage_dir,
+    ingest_workers,
+    retriever,
+    watch_interval,
+    answer_cache_size,
+    answer_cache_ttl,
+    llm_type,
+    llm_endpoint,
+    llm_key,
+    assistant_id,
+):
+    asyncio.run(
+        amain(
+            doc_dir,
+            storage_dir,
+            ingest_workers,
+            retriever,
+            watch_interval,
+            answer_cache_size,
+            answer_cache_ttl,
+            llm_type,
+            llm_endpoint,
+            llm_key,
+            assistant_id,
+        )
+    )
 
 
 def run():
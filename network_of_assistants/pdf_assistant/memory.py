@@ -0,0 +1,100 @@
+import collections
+import textwrap
+
+from agp.text import count_tokens
+from llama_index.core.llms import ChatMessage
+
+
+class TurnMemory:
+    """Chat memory of one conversation, bounded by a token budget and kept to
+    what the assistant needs for its own turns. Messages of others are only
+    held until the assistant is asked to speak, at most max_pending of them,
+    the latest. Each turn then keeps those messages with the answer. The
+    last keep_turns turns are kept verbatim. Older turns are folded into a
+    one-line summary each, and the oldest lines are dropped once the memory
+    outgrows the budget."""
+
+    def __init__(self, token_budget: int = 4000, keep_turns: int = 4, max_pending: int = 8):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+
+        self.pending: collections.deque[ChatMessage] = collections.deque(maxlen=max_pending)
+        # (messages, tokens) of the turns kept verbatim, and (line, tokens)
+        # of the summary
+        self._turns: collections.deque = collections.deque()
+        self._turns_tokens = 0
+        self._summary: collections.deque = collections.deque()
+        self._summary_tokens = 0
+
+        # metrics
+        self.skipped_messages = 0
+        self.folded_turns = 0
+        self.dropped_lines = 0
+
+    @property
+    def turns(self) -> int:
+        return len(self._turns) + self.folded_turns
+
+    def put(self, author: str, text: str):
+        if len(self.pending) == self.pending.maxlen:
+            self.skipped_messages += 1
+        self.pending.append(ChatMessage(role="user", content=f"{author}: {text}"))
+
+    def messages(self) -> list[ChatMessage]:
+        # the chat history of the next agent run
+        history = []
+        if self._summary:
+            lines = [line for line, _ in self._summary]
+            if self.dropped_lines:
+                lines.insert(0, "(earlier turns omitted)")
+            history.append(
+                ChatMessage(role="user", content="Earlier in this conversation:\n" + "\n".join(lines))
+            )
+        for turn, _ in self._turns:
+            history.extend(turn)
+        history.extend(self.pending)
+        return history
+
+    def prompt_tokens(self, user_msg: str = "") -> int:
+        # memory and request the agent run starts from, before the ReAct
+        # prompt and tool outputs
+        pending = sum(count_tokens(message.content) for message in self.pending)
+        return self._summary_tokens + self._turns_tokens + pending + count_tokens(user_msg)
+
+    def record(self, answer: str):
+        turn = list(self.pending) + [ChatMessage(role="assistant", content=answer)]
+        self.pending.clear()
+        tokens = sum(count_tokens(message.content) for message in turn)
+        self._turns.append((turn, tokens))
+        self._turns_tokens += tokens
+
+        # keep at least the newest turn verbatim, whatever its size
+        while len(self._turns) > 1 and (
+            len(self._turns) > self.keep_turns or self._turns_tokens > self.token_budget
+        ):
+            self._fold(*self._turns.popleft())
+
+        while self._summary and self._summary_tokens + self._turns_tokens > self.token_budget:
+            _, line_tokens = self._summary.popleft()
+            self._summary_tokens -= line_tokens
+            self.dropped_lines += 1
+
+    def _fold(self, turn: list[ChatMessage], tokens: int):
+        self._turns_tokens -= tokens
+        asked = [message.content for message in turn if message.role == "user"]
+        line = textwrap.shorten(asked[-1] if asked else "", 120, placeholder="...")
+        line += " -> " + textwrap.shorten(turn[-1].content, 160, placeholder="...")
+        line_tokens = count_tokens(line) + 1
+        self._summary.append((line, line_tokens))
+        self._summary_tokens += line_tokens
+        self.folded_turns += 1
+
+    def stats(self) -> dict:
+        return {
+            "pending_messages": len(self.pending),
+            "skipped_messages": self.skipped_messages,
+            "verbatim_turns": len(self._turns),
+            "folded_turns": self.folded_turns,
+            "summary_lines": len(self._summary),
+            "prompt_tokens": self.prompt_tokens(),
+        }
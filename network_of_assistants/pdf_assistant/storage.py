@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from typing import Optional
+
+from llama_index.core import SimpleKeywordTableIndex, StorageContext
+from llama_index.core import load_index_from_storage
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from bm25 import BM25Retriever
+from ingest import ingest
+
+MANIFEST = "manifest.json"
+BM25_ARRAYS = "bm25.npz"
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def settings_key(splitter, retriever: str = "bm25") -> str:
+    # indexes built with other chunking settings are kept apart
+    settings = {
+        "index": "bm25" if retriever == "bm25" else SimpleKeywordTableIndex.__name__,
+        "splitter": type(splitter).__name__,
+        "chunk_size": splitter.chunk_size,
+        "chunk_overlap": splitter.chunk_overlap,
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _files(doc_dir: str):
+    # relative and full path of every file SimpleDirectoryReader loads
+    for root, dirs, files in os.walk(doc_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, doc_dir), path
+
+
+def scan(doc_dir: str) -> dict[str, str]:
+    # relative path -> content hash
+    return {f: file_hash(path) for f, path in _files(doc_dir)}
+
+
+def stat_signature(doc_dir: str) -> dict[str, tuple[int, int]]:
+    # relative path -> modification time and size, cheap to poll
+    signature = {}
+    for f, path in _files(doc_dir):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature[f] = (stat.st_mtime_ns, stat.st_size)
+    return signature
+
+
+class IndexStore:
+    """Keeps the index of doc_dir in storage_dir, next to a manifest of the
+    content hash of every source file. On start, unchanged files are reused
+    as they are: only added and changed files are read and split, and the
+    nodes of removed ones are deleted.
+
+    With the bm25 retriever, only the nodes and the BM25 arrays are kept and
+    load() returns a BM25Retriever, the arrays being rebuilt only when the
+    documents changed. With the keyword retriever, it is a keyword table
+    index, which asks the LLM for the keywords of every query.
+
+    version is a hash of the indexed content, set by load()."""
+
+    def __init__(
+        self,
+        doc_dir: str,
+        storage_dir: str,
+        splitter,
+        llm,
+        workers: Optional[int] = None,
+        retriever: str = "bm25",
+    ):
+        self.doc_dir = doc_dir
+        self.splitter = splitter
+        self.llm = llm
+        self.workers = workers
+        self.retriever = retriever
+        self.path = os.path.join(storage_dir, settings_key(splitter, retriever))
+        self.version: Optional[str] = None
+
+    def _load_manifest(self) -> dict:
+        # a crash between the two renames of _persist leaves only the
+        # previous version, set aside
+        old = self.path + ".old"
+        if not os.path.exists(self.path) and os.path.exists(old):
+            os.rename(old, self.path)
+        try:
+            with open(os.path.join(self.path, MANIFEST), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _nodes(self, files: list[str]) -> dict[str, list]:
+        # nodes of every file, grouped by file
+        if not files:
+            return {}
+        paths = {os.path.join(self.doc_dir, f): f for f in files}
+        nodes = ingest(list(paths), self.splitter, workers=self.workers)
+        return {paths[path]: file_nodes for path, file_nodes in nodes.items()}
+
+    def load(self):
+        start = time.monotonic()
+        hashes = scan(self.doc_dir)
+        manifest = self._load_manifest()
+
+        changed = [f for f, h in hashes.items() if manifest.get(f, {}).get("hash") != h]
+        removed = [f for f in manifest if f not in hashes]
+
+        index = None
+        if manifest:
+            try:
+                index = self._load_index()
+            except (FileNotFoundError, ValueError) as e:
+                print(f"Error loading the index from {self.path}: {e}")
+                manifest, changed, removed = {}, list(hashes), []
+
+        if index is not None and not changed and not removed:
+            self.version = self._version(manifest)
+            print(f"Loaded the index of {len(hashes)} files in {time.monotonic() - start:.1f}s")
+            return index
+
+        stale = [
+            doc_id
+            for f in removed + [f for f in changed if f in manifest]
+            for doc_id in manifest.pop(f)["doc_ids"]
+        ]
+        nodes = self._nodes(changed)
+        index = self._update(index, stale, [node for file_nodes in nodes.values() for node in file_nodes])
+
+        for f, file_nodes in nodes.items():
+            manifest[f] = {
+                "hash": hashes[f],
+                "doc_ids": sorted({node.ref_doc_id for node in file_nodes}),
+            }
+        self._persist(index, manifest)
+        self.version = self._version(manifest)
+
+        print(
+            f"Indexed {len(changed)} changed and dropped {len(removed)} removed of "
+            f"{len(hashes)} files in {time.monotonic() - start:.1f}s"
+        )
+        return index
+
+    def _load_index(self):
+        if self.retriever == "bm25":
+            docstore = SimpleDocumentStore.from_persist_dir(self.path)
+            return BM25Retriever.from_docstore(
+                docstore, persisted=os.path.join(self.path, BM25_ARRAYS)
+            )
+        storage_context = StorageContext.from_defaults(persist_dir=self.path)
+        return load_index_from_storage(storage_context, llm=self.llm)
+
+    def _update(self, index, stale: list[str], nodes: list):
+        # drop the documents of stale and add nodes
+        if self.retriever == "bm25":
+            docstore = index.docstore if index is not None else SimpleDocumentStore()
+            for doc_id in stale:
+                docstore.delete_ref_doc(doc_id, raise_error=False)
+            docstore.add_documents(nodes)
+            return BM25Retriever.from_docstore(docstore)
+
+        if index is None:
+            return SimpleKeywordTableIndex(nodes=nodes, llm=self.llm, show_progress=True)
+        for doc_id in stale:
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+        index.insert_nodes(nodes)
+        return index
+
+    def _write_index(self, index, path: str):
+        os.makedirs(path, exist_ok=True)
+        if self.retriever == "bm25":
+            index.docstore.persist(os.path.join(path, "docstore.json"))
+            index.save(os.path.join(path, BM25_ARRAYS))
+        else:
+            index.storage_context.persist(persist_dir=path)
+
+    def _version(self, manifest: dict) -> str:
+        hashes = sorted((f, entry["hash"]) for f, entry in manifest.items())
+        content = json.dumps([os.path.basename(self.path), hashes])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+    def _persist(self, index, manifest: dict):
+        # written next to the current version and swapped in once complete.
+        # The current version is only deleted after the new one took its
+        # place, so one of them is on disk whenever the process dies
+        tmp, old = self.path + ".tmp", self.path + ".old"
+        shutil.rmtree(tmp, ignore_errors=True)
+        self._write_index(index, tmp)
+        with open(os.path.join(tmp, MANIFEST), "w") as file:
+            json.dump(manifest, file)
+        shutil.rmtree(old, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.rename(self.path, old)
+        os.rename(tmp, self.path)
+        shutil.rmtree(old, ignore_errors=True)
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from llama_index.core.llms import ChatMessage
+
+from answers import AnswerCache, context_digest
+
+
+def get(cache, *args):
+    return asyncio.run(cache.get(*args))
+
+
+def test_hit_on_normalized_question(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    assert get(cache, "How do I configure a VLAN?", "v1") is None
+    cache.put("How do I configure a VLAN?", "v1", "vlan 10")
+    assert get(cache, "how do i configure a vlan", "v1") == "vlan 10"
+    assert get(cache, "how do i configure a vlan", "v2") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_context_is_part_of_the_key(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    first = context_digest([ChatMessage(role="user", content="user-proxy: VLANs?")])
+    second = context_digest([ChatMessage(role="user", content="user-proxy: BGP?")])
+    cache.put("Can you give an example?", "v1", "vlan 10", first)
+    assert get(cache, "Can you give an example?", "v1", first) == "vlan 10"
+    assert get(cache, "Can you give an example?", "v1", second) is None
+    assert get(cache, "Can you give an example?", "v1") is None
+
+
+def test_persists_across_instances(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(path)
+    cache.put("q", "v1", "a")
+    asyncio.run(cache.close())
+
+    cache = AnswerCache(path)
+    assert get(cache, "q", "v1") == "a"
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_ttl(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), ttl=0.05)
+    cache.put("q", "v1", "a")
+    time.sleep(0.1)
+    assert get(cache, "q", "v1") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_invalidate_drops_other_versions(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"))
+    cache.put("q", "v1", "old")
+    cache.put("q", "v2", "new")
+    asyncio.run(cache.invalidate("v2"))
+    assert get(cache, "q", "v1") is None
+    assert get(cache, "q", "v2") == "new"
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_lru_evicts_from_memory_only(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite"), max_entries=1)
+    cache.put("q1", "v1", "a1")
+    cache.put("q2", "v1", "a2")
+    assert len(cache) == 1
+    assert get(cache, "q1", "v1") == "a1"
+    assert cache.stats()["evictions"] >= 1
+
+
+def test_writes_are_committed_in_batches(tmp_path):
+    path = str(tmp_path / "answers.sqlite")
+    cache = AnswerCache(path)
+    for i in range(50):
+        cache.put(f"q{i}", "v1", f"a{i}")
+    asyncio.run(cache.close())
+    assert cache.stats()["commits"] < 50
+
+    cache = AnswerCache(path, max_entries=1)
+    assert get(cache, "q49", "v1") == "a49"
+    assert get(cache, "q0", "v1") == "a0"
@@ -0,0 +1,74 @@
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from bm25 import BM25Index, BM25Retriever, tokenize
+
+TEXTS = [
+    "Configure a VLAN on the switch with the vlan command.",
+    "The router forwards packets between networks.",
+    "BGP peers exchange routes. Configure BGP on the router.",
+    "Nothing relevant here at all.",
+]
+
+
+def test_tokenize():
+    assert tokenize("How do I configure the ip-address of eth0.1?") == [
+        "configure",
+        "ip-address",
+        "eth0.1",
+    ]
+
+
+def test_search_ranks_by_relevance():
+    index = BM25Index(TEXTS)
+    assert [doc for doc, _ in index.search("vlan")] == [0]
+    assert [doc for doc, _ in index.search("configure bgp router")][:1] == [2]
+    assert index.search("ospf") == []
+    assert index.search("the") == []
+
+
+def test_scores_are_sorted_and_limited():
+    index = BM25Index(TEXTS)
+    results = index.search("configure router vlan bgp packets", top_k=2)
+    assert len(results) == 2
+    assert results[0][1] >= results[1][1] > 0
+
+
+def test_rarer_terms_weigh_more():
+    index = BM25Index(["apple banana", "apple cherry", "apple durian"])
+    (doc, score), *rest = index.search("apple banana")
+    assert doc == 0
+    assert all(score > other for _, other in rest)
+
+
+def test_empty_index():
+    assert BM25Index([]).search("vlan") == []
+
+
+def test_retriever():
+    nodes = [TextNode(text=text, id_=str(n)) for n, text in enumerate(TEXTS)]
+    retriever = BM25Retriever(nodes, similarity_top_k=1)
+    results = retriever.retrieve(QueryBundle("vlan switch"))
+    assert [result.node.node_id for result in results] == ["0"]
+
+
+def test_save_and_load(tmp_path):
+    index = BM25Index(TEXTS)
+    path = str(tmp_path / "bm25.npz")
+    index.save(path, ["a", "b", "c", "d"])
+
+    loaded, node_ids = BM25Index.load(path)
+    assert node_ids == ["a", "b", "c", "d"]
+    assert loaded.search("configure bgp router") == index.search("configure bgp router")
+    assert (loaded.k1, loaded.b) == (index.k1, index.b)
+
+
+def test_outdated_arrays_are_rebuilt(tmp_path):
+    nodes = [TextNode(text=text, id_=str(n)) for n, text in enumerate(TEXTS)]
+    path = str(tmp_path / "bm25.npz")
+    BM25Retriever(nodes[:2]).save(path)
+
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(nodes)
+    retriever = BM25Retriever.from_docstore(docstore, persisted=path)
+    assert retriever.index.size == len(TEXTS)
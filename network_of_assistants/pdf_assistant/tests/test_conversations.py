@@ -0,0 +1,37 @@
+from agp.conversations import ConversationStore
+
+from conversations import Conversation
+from memory import TurnMemory
+
+
+def store(max_conversations: int = 2) -> ConversationStore:
+    # as in main: never expired, only the least recently active are dropped
+    return ConversationStore(
+        lambda conversation_id: Conversation(conversation_id, TurnMemory()),
+        idle_ttl=None,
+        max_conversations=max_conversations,
+    )
+
+
+def test_conversations_have_their_own_memory():
+    conversations = store()
+    first = conversations.get("first")
+    first.memory.put("user-proxy", "What is a VLAN?")
+    first.question, first.asker = "What is a VLAN?", "user-proxy"
+    first.memory.record("A virtual LAN.")
+
+    second = conversations.get("second")
+    assert second.memory.messages() == []
+    assert (second.question, second.asker) == (None, None)
+    assert conversations.get("first").memory.turns == 1
+
+
+def test_least_recently_active_conversation_is_dropped():
+    conversations = store(max_conversations=2)
+    first = conversations.get("first")
+    conversations.get("second")
+    conversations.get("first")
+    conversations.get("third")
+
+    assert conversations.get("first") is first
+    assert conversations.stats() == {"conversations": 2, "created": 3, "expired": 0, "evicted": 1}
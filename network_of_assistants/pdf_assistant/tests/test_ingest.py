@@ -0,0 +1,62 @@
+from llama_index.core.node_parser import SentenceSplitter
+from pypdf import PdfWriter
+
+from ingest import ingest, plan
+
+
+class WordSplitter(SentenceSplitter):
+    # splits on whitespace, so that no tokenizer has to be downloaded
+    def __init__(self, **kwargs):
+        super().__init__(tokenizer=str.split, **kwargs)
+
+
+def write(tmp_path, name: str, text: str) -> str:
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def write_pdf(tmp_path, name: str, pages: int) -> str:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    path = str(tmp_path / name)
+    writer.write(path)
+    return path
+
+
+def test_plan_splits_pdfs_in_page_ranges(tmp_path):
+    text = write(tmp_path, "a.txt", "alpha")
+    pdf = write_pdf(tmp_path, "b.PDF", pages=5)
+    assert plan([text, pdf], pages_per_task=2) == [
+        (text, None),
+        (pdf, (0, 2)),
+        (pdf, (2, 4)),
+        (pdf, (4, 5)),
+    ]
+
+
+def test_nodes_are_grouped_by_file(tmp_path):
+    paths = [
+        write(tmp_path, "a.txt", "alpha bravo"),
+        write(tmp_path, "b.txt", "charlie delta"),
+    ]
+    splitter = WordSplitter(chunk_size=64, chunk_overlap=0)
+    nodes = ingest(paths, splitter, workers=1)
+
+    assert list(nodes) == paths
+    assert [node.get_content() for node in nodes[paths[0]]] == ["alpha bravo"]
+    assert [node.get_content() for node in nodes[paths[1]]] == ["charlie delta"]
+    # the ids SimpleDirectoryReader gives with filename_as_id, which the
+    # index store records per file
+    assert {node.ref_doc_id for node in nodes[paths[0]]} == {paths[0]}
+
+
+def test_worker_processes_give_the_same_nodes(tmp_path):
+    paths = [write(tmp_path, f"{name}.txt", f"{name} text") for name in ("a", "b", "c")]
+    splitter = WordSplitter(chunk_size=64, chunk_overlap=0)
+
+    def contents(nodes):
+        return {path: [node.get_content() for node in file_nodes] for path, file_nodes in nodes.items()}
+
+    assert contents(ingest(paths, splitter, workers=2)) == contents(ingest(paths, splitter, workers=1))
@@ -0,0 +1,67 @@
+from agp.text import count_tokens
+
+from memory import TurnMemory
+
+
+def test_pending_messages_are_bounded():
+    memory = TurnMemory(max_pending=2)
+    for n in range(3):
+        memory.put("user-proxy", f"message {n}")
+
+    assert [m.content for m in memory.messages()] == [
+        "user-proxy: message 1",
+        "user-proxy: message 2",
+    ]
+    assert memory.skipped_messages == 1
+
+
+def test_turns_keep_their_messages_and_answer():
+    memory = TurnMemory()
+    memory.put("user-proxy", "What is a VLAN?")
+    memory.record("A virtual LAN.")
+
+    assert memory.turns == 1
+    assert [(m.role, m.content) for m in memory.messages()] == [
+        ("user", "user-proxy: What is a VLAN?"),
+        ("assistant", "A virtual LAN."),
+    ]
+    assert memory.stats()["pending_messages"] == 0
+
+
+def test_old_turns_are_folded():
+    memory = TurnMemory(token_budget=10_000, keep_turns=2)
+    for n in range(4):
+        memory.put("user-proxy", f"question {n}")
+        memory.record(f"answer {n}")
+
+    messages = memory.messages()
+    assert messages[0].content == (
+        "Earlier in this conversation:\n"
+        "user-proxy: question 0 -> answer 0\n"
+        "user-proxy: question 1 -> answer 1"
+    )
+    assert [m.content for m in messages[1:]] == [
+        "user-proxy: question 2",
+        "answer 2",
+        "user-proxy: question 3",
+        "answer 3",
+    ]
+    assert memory.turns == 4
+    assert memory.folded_turns == 2
+
+
+def test_token_budget():
+    memory = TurnMemory(token_budget=300, keep_turns=2)
+    for n in range(30):
+        memory.put("user-proxy", f"question {n} " + "x" * 100)
+        memory.record(f"answer {n} " + "y" * 100)
+
+    assert memory.prompt_tokens() <= 300
+    assert memory.dropped_lines > 0
+    assert "(earlier turns omitted)" in memory.messages()[0].content
+    assert memory.messages()[-1].content.startswith("answer 29")
+
+
+def test_prompt_tokens_include_the_request():
+    memory = TurnMemory()
+    assert memory.prompt_tokens("hello") == count_tokens("hello")
@@ -0,0 +1,104 @@
+import os
+
+from llama_index.core.llms import MockLLM
+from llama_index.core.node_parser import SentenceSplitter
+
+import bm25
+from storage import BM25_ARRAYS, IndexStore, scan, stat_signature
+
+
+class WordSplitter(SentenceSplitter):
+    # splits on whitespace, so that no tokenizer has to be downloaded
+    def __init__(self, **kwargs):
+        super().__init__(tokenizer=str.split, **kwargs)
+
+
+def store(tmp_path, retriever: str = "bm25"):
+    splitter = WordSplitter(chunk_size=64, chunk_overlap=0)
+    return IndexStore(
+        str(tmp_path / "docs"),
+        str(tmp_path / "storage"),
+        splitter,
+        MockLLM(),
+        workers=1,
+        retriever=retriever,
+    )
+
+
+def write(tmp_path, name: str, text: str):
+    (tmp_path / "docs").mkdir(exist_ok=True)
+    (tmp_path / "docs" / name).write_text(text)
+
+
+def test_scan_skips_hidden_files(tmp_path):
+    write(tmp_path, "a.txt", "alpha")
+    write(tmp_path, ".hidden", "beta")
+    assert list(scan(str(tmp_path / "docs"))) == ["a.txt"]
+    assert list(stat_signature(str(tmp_path / "docs"))) == ["a.txt"]
+
+
+def texts(index) -> list[str]:
+    return sorted(node.get_content() for node in index.docstore.docs.values())
+
+
+def test_reload_is_incremental(tmp_path):
+    write(tmp_path, "a.txt", "alpha bravo")
+    write(tmp_path, "b.txt", "charlie delta")
+    first = store(tmp_path)
+    index = first.load()
+    assert texts(index) == ["alpha bravo", "charlie delta"]
+
+    # unchanged: same version, nothing reindexed
+    second = store(tmp_path)
+    second.load()
+    assert second.version == first.version
+
+    os.remove(tmp_path / "docs" / "b.txt")
+    write(tmp_path, "c.txt", "echo foxtrot")
+    third = store(tmp_path)
+    index = third.load()
+    assert texts(index) == ["alpha bravo", "echo foxtrot"]
+    assert [node.get_content() for node in index.retrieve("foxtrot")] == ["echo foxtrot"]
+    assert third.version != first.version
+
+
+def test_bm25_keeps_only_nodes_and_arrays(tmp_path, monkeypatch):
+    write(tmp_path, "a.txt", "alpha bravo")
+    first = store(tmp_path)
+    first.load()
+    assert sorted(os.listdir(first.path)) == [BM25_ARRAYS, "docstore.json", "manifest.json"]
+
+    # an unchanged directory is served from the persisted arrays
+    def rebuild(*args, **kwargs):
+        raise AssertionError("the BM25 index was rebuilt")
+
+    monkeypatch.setattr(bm25.BM25Index, "__init__", rebuild)
+    index = store(tmp_path).load()
+    assert [node.get_content() for node in index.retrieve("bravo")] == ["alpha bravo"]
+
+
+def test_keyword_index(tmp_path):
+    write(tmp_path, "a.txt", "alpha bravo")
+    first = store(tmp_path, retriever="keyword")
+    assert texts(first.load()) == ["alpha bravo"]
+
+    write(tmp_path, "b.txt", "charlie delta")
+    second = store(tmp_path, retriever="keyword")
+    assert texts(second.load()) == ["alpha bravo", "charlie delta"]
+    assert second.path != store(tmp_path).path
+
+
+def test_crash_between_renames_keeps_the_previous_version(tmp_path):
+    write(tmp_path, "a.txt", "alpha bravo")
+    first = store(tmp_path)
+    first.load()
+
+    # the state _persist leaves when the process dies after setting the
+    # current version aside
+    os.rename(first.path, first.path + ".old")
+
+    second = store(tmp_path)
+    second.load()
+    assert second.version == first.version
+    assert os.path.exists(second.path)
+    assert not os.path.exists(second.path + ".old")
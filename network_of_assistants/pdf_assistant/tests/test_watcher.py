@@ -0,0 +1,39 @@
+import asyncio
+
+from watcher import IndexWatcher, VersionedQueryEngine
+
+
+class FlakyStore:
+    # fails the first reindex, like a PDF that is still being copied
+    def __init__(self, doc_dir: str):
+        self.doc_dir = doc_dir
+        self.version = "v0"
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        if self.loads == 1:
+            raise ValueError("truncated file")
+        self.version = f"v{self.loads}"
+        return f"index {self.version}"
+
+
+def test_failed_reindex_is_retried(tmp_path):
+    async def scenario():
+        store = FlakyStore(str(tmp_path))
+        engine = VersionedQueryEngine(object(), store.version)
+        watcher = IndexWatcher(store, lambda index: index, engine, interval=0.02)
+        task = asyncio.create_task(watcher.run())
+
+        await asyncio.sleep(0.05)
+        (tmp_path / "manual.txt").write_text("Use vlan 10")
+        for _ in range(100):
+            if watcher.swaps:
+                break
+            await asyncio.sleep(0.02)
+
+        task.cancel()
+        assert store.loads == 2
+        assert engine.current == ("v2", "index v2")
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Optional
+
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.schema import QueryBundle
+
+from storage import IndexStore, stat_signature
+
+
+class VersionedQueryEngine(BaseQueryEngine):
+    """Query engine over the current version of the index. A new version is
+    swapped in with a single assignment: queries already running hold on to
+    the engine they started with and finish on the old version."""
+
+    def __init__(self, engine: BaseQueryEngine, version: str):
+        super().__init__(callback_manager=None)
+        self.current = (version, engine)
+
+    @property
+    def version(self) -> str:
+        return self.current[0]
+
+    def swap(self, engine: BaseQueryEngine, version: str):
+        self.current = (version, engine)
+
+    def _query(self, query_bundle: QueryBundle):
+        _, engine = self.current
+        return engine.query(query_bundle)
+
+    async def _aquery(self, query_bundle: QueryBundle):
+        _, engine = self.current
+        return await engine.aquery(query_bundle)
+
+    def _get_prompt_modules(self) -> dict:
+        return {}
+
+
+class IndexWatcher:
+    """Polls the documentation directory every interval seconds and, once a
+    change has settled for one interval (a file may still be copying),
+    updates the index incrementally with IndexStore.load() and swaps a query
+    engine built on the new version into engine. Indexing runs in a thread,
+    so that the assistant keeps answering meanwhile. on_swap is awaited with
+    every new version."""
+
+    def __init__(
+        self,
+        store: IndexStore,
+        build_engine: Callable[[object], BaseQueryEngine],
+        engine: VersionedQueryEngine,
+        interval: float = 10.0,
+        on_swap: Optional[Callable[[str], Awaitable]] = None,
+    ):
+        self.store = store
+        self.build_engine = build_engine
+        self.engine = engine
+        self.interval = interval
+        self.on_swap = on_swap
+        self.swaps = 0
+
+    async def run(self):
+        indexed = seen = await asyncio.to_thread(stat_signature, self.store.doc_dir)
+        while True:
+            await asyncio.sleep(self.interval)
+            current = await asyncio.to_thread(stat_signature, self.store.doc_dir)
+            if current != seen:
+                seen = current
+                continue
+            if current == indexed:
+                continue
+
+            # a failed reindex, a file still copying or that does not parse,
+            # is retried every interval until it goes through
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error reindexing {self.store.doc_dir}: {e}")
+            else:
+                indexed = current
+
+    async def refresh(self):
+        start = time.monotonic()
+        index = await asyncio.to_thread(self.store.load)
+        if self.store.version == self.engine.version:
+            return
+
+        engine = await asyncio.to_thread(self.build_engine, index)
+        self.engine.swap(engine, self.store.version)
+        self.swaps += 1
+        if self.on_swap is not None:
+            await self.on_swap(self.store.version)
+        print(
+            f"Swapped in index version {self.store.version} in "
+            f"{time.monotonic() - start:.1f}s"
+        )
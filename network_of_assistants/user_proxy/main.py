@@ -1,7 +1,8 @@
 import argparse
 import asyncio
+import uuid
 from agp import AGP
-import json
+from agp.codec import decode
 import os
 
 
@@ -21,10 +22,16 @@ class color:
 # Queue for receiving responses
 request_to_speak_event = asyncio.Event()
 
+# every run of the user proxy is its own conversation with the moderator
+conversation_id = None
+
 
 async def command_callback(response):
-    decoded_message = response.decode("utf-8")
-    data = json.loads(decoded_message)
+    data = decode(response)
+
+    # ignore the traffic of other conversations in the shared space
+    if data.get("conversation_id", conversation_id) != conversation_id:
+        return
 
     if data["type"] == "ChatMessage":
         print(color.BOLD + f"{data['author']}:" + color.END + f" {data['message']}")
@@ -37,10 +44,14 @@ async def command_callback(response):
 
 
 async def main(args):
+    global conversation_id
+    conversation_id = args.conversation_id or uuid.uuid4().hex
+
     agp = AGP(
         agp_endpoint=args.endpoint,
         local_id="user-proxy",
         shared_space="chat",
+        codec=args.codec,
     )
 
     print("Welcome to the NoA! Type your message. Type 'quit' to exit.")
@@ -57,12 +68,13 @@ async def main(args):
             "type": "ChatMessage",
             "author": "user-proxy",
             "message": inputMessage,
+            "conversation_id": conversation_id,
         }
 
         # clean the request to speak event ready to be told to speak again
         request_to_speak_event.clear()
 
-        await agp.publish(msg=json.dumps(message).encode("utf-8"))
+        await agp.send(message)
 
         # wait until we're told to speak again
         await request_to_speak_event.wait()
@@ -77,6 +89,21 @@ def run():
         help="AGP endpoint URL (e.g., http://localhost:46357)",
     )
 
+    parser.add_argument(
+        "--codec",
+        type=str,
+        default=os.getenv("AGP_CODEC", "json"),
+        choices=["json", "binary"],
+        help="Encoding of the messages sent to the chat",
+    )
+
+    parser.add_argument(
+        "--conversation-id",
+        type=str,
+        default=None,
+        help="Id of the conversation to join, a new one by default",
+    )
+
     print("AGP endpoint:", parser.parse_args().endpoint)
 
     args = parser.parse_args()